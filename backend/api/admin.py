@@ -0,0 +1,37 @@
+from django.contrib import admin
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+
+from .slow_queries import slow_query_log
+
+
+SLOW_QUERIES_TITLE = 'Медленные SQL-запросы'
+
+
+def slow_queries_view(request):
+    """
+    Функция просмотра журнала медленных SQL-запросов в админ-зоне
+    с отбором по маршруту (параметр route); POST-запрос очищает журнал.
+    """
+    if request.method == 'POST':
+        slow_query_log.clear()
+        return redirect(request.path)
+    records = slow_query_log.get_records()
+    route = request.GET.get('route') or None
+    return TemplateResponse(
+        request,
+        'admin/slow_queries.html',
+        {
+            **admin.site.each_context(request),
+            'title': SLOW_QUERIES_TITLE,
+            'routes': sorted({
+                record['route'] for record in records if record['route']
+            }),
+            'route': route,
+            'records': [
+                record for record in records
+                if route is None or record['route'] == route
+            ],
+            'slow_query_log': slow_query_log,
+        }
+    )
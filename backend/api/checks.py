@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+PROCESS_LOCAL_CACHE = (
+    'Кэш {backend} доступен только одному процессу: версии справочников, '
+    'сброс кэша ответов, индексов тегов и продуктов и множеств '
+    'избранного и подписок не дойдут до других процессов gunicorn '
+    'и команд manage.py.'
+)
+PROCESS_LOCAL_CACHE_HINT = (
+    'Задайте в CACHE_BACKEND общий кэш (FileBasedCache для одного хоста, '
+    'Memcached или Redis для нескольких).'
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Функция проверки, что кэш по умолчанию общий для процессов
+    (вне режима отладки).
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        PROCESS_LOCAL_CACHE.format(backend=backend),
+        hint=PROCESS_LOCAL_CACHE_HINT,
+        id='api.W001'
+    )]
@@ -1,16 +1,42 @@
+from django import forms
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Exists, OuterRef
 from django_filters.rest_framework import FilterSet
 from django_filters.rest_framework.filters import (
     CharFilter,
-    ModelMultipleChoiceFilter,
+    ChoiceFilter,
+    MultipleChoiceFilter,
     NumberFilter
 )
 
-from recipes.models import Ingredient, Recipe, Tag
+from .tag_index import tag_index
+from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes
 
 
 User = get_user_model()
 
+TAGS_MATCH_ANY = 'any'
+TAGS_MATCH_ALL = 'all'
+TAGS_MATCH_CHOICES = (
+    (TAGS_MATCH_ANY, 'Любой из тегов'),
+    (TAGS_MATCH_ALL, 'Все теги'),
+)
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_index.slugs()]
+
+
+class TagSlugsFilter(MultipleChoiceFilter):
+    """
+    Класс фильтра по слагам тегов.
+    Поле формы Django получает допустимые слаги только при проверке
+    значения, поэтому запросы без тегов не обращаются к индексу тегов.
+    """
+
+    field_class = forms.MultipleChoiceField
+
 
 class IngredientFilter(FilterSet):
     """Класс фильтра для названия продуктов."""
@@ -26,12 +52,22 @@ class IngredientFilter(FilterSet):
 
 
 class RecipeFilter(FilterSet):
-    """Класс фильтра для модели рецепта."""
+    """
+    Класс фильтра для модели рецепта.
+    Теги задаются слагами (tags), слаги переводятся в id по индексу
+    тегов в памяти процесса; отбор выполняется подзапросом EXISTS
+    к связям рецептов и тегов без обращения к таблице тегов
+    и без DISTINCT. Параметр tags_match задает отбор рецептов
+    с любым из тегов (any, по умолчанию) или со всеми тегами (all).
+    """
 
-    tags = ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
+    tags = TagSlugsFilter(
+        choices=tag_choices,
+        method='tags_get',
+    )
+    tags_match = ChoiceFilter(
+        choices=TAGS_MATCH_CHOICES,
+        method='tags_match_get',
     )
     is_favorited = NumberFilter(
         method='is_favorited_get',
@@ -39,6 +75,9 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = NumberFilter(
         method='is_in_shopping_cart_get',
     )
+    search = CharFilter(
+        method='search_get',
+    )
 
     class Meta:
         model = Recipe
@@ -46,8 +85,25 @@ class RecipeFilter(FilterSet):
             'author',
             'is_favorited',
             'is_in_shopping_cart',
-            'tags__slug'
+            'search',
+            'tags',
+            'tags_match'
+        )
+
+    def tags_get(self, recipes, name, value):
+        ids = tag_index.get_ids(value)
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=ids
         )
+        if self.form.cleaned_data.get('tags_match') == TAGS_MATCH_ALL:
+            recipe_tags = recipe_tags.values('recipe_id').annotate(
+                tags_count=Count('tag_id')
+            ).filter(tags_count=len(ids))
+        return recipes.filter(Exists(recipe_tags))
+
+    def tags_match_get(self, recipes, name, value):
+        return recipes
 
     def is_favorited_get(self, recipes, name, value):
         if self.request.user.is_authenticated and value:
@@ -58,3 +114,6 @@ class RecipeFilter(FilterSet):
         if self.request.user.is_authenticated and value:
             return recipes.filter(shoppingcarts__user=self.request.user)
         return recipes
+
+    def search_get(self, recipes, name, value):
+        return search_recipes(recipes, value)
@@ -0,0 +1,98 @@
+import logging
+from bisect import bisect_left
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count
+
+from .mixins import get_reference_version
+from recipes.models import Ingredient
+
+
+logger = logging.getLogger(__name__)
+
+PREFIX_END = '\U0010ffff'
+
+
+class IngredientIndex:
+    """
+    Индекс названий продуктов в памяти процесса для автодополнения.
+    Названия в нижнем регистре хранятся в отсортированном списке,
+    поиск по началу названия выполняется бинарным поиском,
+    при отсутствии совпадений по началу - поиском подстроки.
+    Индекс перестраивается после изменения продуктов (в том числе
+    в другом процессе - по версии справочника в кэше)
+    и не реже одного раза в ttl секунд.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = Lock()
+        self.built_at = None
+        self.version = None
+        self.names = []
+        self.ingredients = []
+
+    def build(self):
+        self.version = get_reference_version(Ingredient)
+        ingredients = sorted(
+            Ingredient.objects.annotate(
+                usage=Count('ingredients_recipes')
+            ).order_by(),
+            key=lambda ingredient: (ingredient.name.lower(), ingredient.pk)
+        )
+        self.names = [ingredient.name.lower() for ingredient in ingredients]
+        self.ingredients = ingredients
+        self.built_at = monotonic()
+
+    def warm_up(self):
+        """Функция построения индекса при запуске процесса."""
+        try:
+            self.build()
+        except DatabaseError:
+            logger.warning('Индекс продуктов будет построен при запросе.')
+
+    def invalidate(self):
+        self.built_at = None
+
+    def ensure_built(self):
+        version = get_reference_version(Ingredient)
+        with self.lock:
+            if (
+                self.built_at is None
+                or self.version != version
+                or monotonic() - self.built_at > self.ttl
+            ):
+                self.build()
+            return self.names, self.ingredients
+
+    def search(self, query):
+        """
+        Функция поиска продуктов по началу названия без учета регистра.
+        Сначала идут точные совпадения, затем совпадения по началу
+        и по подстроке; внутри групп - по частоте использования в рецептах.
+        """
+        names, ingredients = self.ensure_built()
+        query = query.lower()
+        start = bisect_left(names, query)
+        end = bisect_left(names, query + PREFIX_END, start)
+        found = ingredients[start:end]
+        if not found:
+            found = [
+                ingredient
+                for name, ingredient in zip(names, ingredients)
+                if query in name
+            ]
+        return sorted(
+            found,
+            key=lambda ingredient: (
+                ingredient.name.lower() != query,
+                not ingredient.name.lower().startswith(query),
+                -ingredient.usage
+            )
+        )
+
+
+ingredient_index = IngredientIndex(ttl=settings.INGREDIENT_INDEX_TTL)
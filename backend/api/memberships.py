@@ -0,0 +1,118 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import IntegerField, Value
+
+from recipes.models import Favorite, ShoppingCart, Subscribe
+
+
+MEMBERSHIP_FIELDS = {
+    Favorite: 'recipe_id',
+    ShoppingCart: 'recipe_id',
+    Subscribe: 'author_id',
+}
+MEMBERSHIP_KINDS = {
+    model: kind for kind, model in enumerate(MEMBERSHIP_FIELDS)
+}
+
+VERSION_KEY = 'membership-version:{user}'
+SETS_KEY = 'membership:{user}:{version}'
+REQUEST_ATTRIBUTE = 'memberships'
+
+
+class MembershipCache:
+    """
+    Кэш множеств id избранных рецептов, рецептов в списке покупок
+    и авторов подписок пользователей.
+    Множества хранятся в кэше Django alias (общем для процессов) ttl
+    секунд, число записей ограничено настройкой MAX_ENTRIES кэша.
+    Множества загружаются одним запросом при первом обращении;
+    если в одном из них больше max_ids записей, множества пользователя
+    не используются (None), и флаги вычисляются подзапросами EXISTS.
+    После фиксации транзакции, изменившей связи пользователя, версия
+    его записи меняется, и множества загружаются заново.
+    """
+
+    def __init__(self, alias, ttl, max_ids):
+        self.alias = alias
+        self.ttl = ttl
+        self.max_ids = max_ids
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_version(self, user_id):
+        key = VERSION_KEY.format(user=user_id)
+        version = self.cache.get(key)
+        if version is None:
+            self.cache.add(key, uuid4().hex, self.ttl)
+            version = self.cache.get(key)
+        return version
+
+    def load(self, user_id):
+        """
+        Функция загрузки множеств пользователя из БД
+        (модель -> множество id или None, если id больше max_ids).
+        """
+        rows = [
+            model.objects.filter(user_id=user_id).order_by().values_list(
+                Value(MEMBERSHIP_KINDS[model], output_field=IntegerField()),
+                field
+            )
+            for model, field in MEMBERSHIP_FIELDS.items()
+        ]
+        sets = {model: set() for model in MEMBERSHIP_FIELDS}
+        models = list(MEMBERSHIP_FIELDS)
+        for kind, id in rows[0].union(*rows[1:], all=True):
+            sets[models[kind]].add(id)
+        return {
+            model: frozenset(ids) if len(ids) <= self.max_ids else None
+            for model, ids in sets.items()
+        }
+
+    def get(self, user_id):
+        """Функция получения множеств пользователя (модель -> id)."""
+        key = SETS_KEY.format(user=user_id, version=self.get_version(user_id))
+        sets = self.cache.get(key)
+        if sets is None:
+            sets = self.load(user_id)
+            self.cache.set(key, sets, self.ttl)
+        return sets
+
+    def for_request(self, request):
+        """
+        Функция получения множеств текущего пользователя,
+        загруженных не более одного раза за запрос.
+        """
+        if request.user.is_anonymous:
+            return dict.fromkeys(MEMBERSHIP_FIELDS, frozenset())
+        sets = getattr(request, REQUEST_ATTRIBUTE, None)
+        if sets is None:
+            sets = self.get(request.user.pk)
+            setattr(request, REQUEST_ATTRIBUTE, sets)
+        return sets
+
+    def complete(self, request):
+        """Функция проверки, что кэш содержит все множества пользователя."""
+        return all(
+            ids is not None for ids in self.for_request(request).values()
+        )
+
+    def invalidate(self, user_id):
+        """
+        Функция сброса множеств пользователя после фиксации транзакции.
+        """
+        key = VERSION_KEY.format(user=user_id)
+        transaction.on_commit(
+            lambda: self.cache.set(key, uuid4().hex, self.ttl)
+        )
+
+
+memberships = MembershipCache(
+    alias=settings.MEMBERSHIP_CACHE,
+    ttl=settings.MEMBERSHIP_CACHE_TTL,
+    max_ids=settings.MEMBERSHIP_CACHE_MAX_IDS
+)
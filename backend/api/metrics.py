@@ -0,0 +1,205 @@
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+
+from .slow_queries import slow_query_log
+
+
+PHASES = ('db', 'serializer', 'render')
+SERIALIZER_PHASE = 'serializer'
+
+current_stats = ContextVar('current_stats', default=None)
+
+
+class RequestStats:
+    """
+    Статистика одного запроса: число SQL-запросов
+    и время фаз обработки (БД, сериализация, рендеринг) в секундах.
+    Медленные SQL-запросы записываются в журнал slow_query_log.
+    """
+
+    __slots__ = ('request', 'queries', 'durations', 'active')
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.active = set()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Функция подсчета SQL-запросов и времени их выполнения."""
+        if slow_query_log.explaining.get():
+            return execute(sql, params, many, context)
+        start = perf_counter()
+        try:
+            result = execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.queries += 1
+            self.durations['db'] += duration
+        if not many and slow_query_log.is_slow(duration):
+            slow_query_log.capture(
+                context['connection'],
+                sql,
+                params,
+                duration,
+                self.request
+            )
+        return result
+
+    def server_timing(self, total):
+        """Функция формирования значения заголовка Server-Timing."""
+        metrics = [
+            f'db;dur={self.durations["db"] * 1000:.1f};'
+            f'desc="{self.queries} queries"',
+            *(
+                f'{phase};dur={self.durations[phase] * 1000:.1f}'
+                for phase in PHASES[1:]
+            ),
+            f'total;dur={total * 1000:.1f}',
+        ]
+        return ', '.join(metrics)
+
+
+@contextmanager
+def phase(name):
+    """
+    Контекстный менеджер учета времени фазы текущего запроса.
+    Вложенные вызовы одной фазы учитываются один раз.
+    """
+    stats = current_stats.get()
+    if stats is None or name in stats.active:
+        yield
+        return
+    stats.active.add(name)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stats.durations[name] += perf_counter() - start
+        stats.active.discard(name)
+
+
+class TimedSerializerMixin:
+    """
+    Примесь сериализатора, учитывающая преобразование объектов
+    в фазе serializer. Вложенные сериализаторы и элементы списка
+    внутри этой фазы не учитываются повторно.
+    """
+
+    def to_representation(self, instance):
+        stats = current_stats.get()
+        if stats is None or SERIALIZER_PHASE in stats.active:
+            return super().to_representation(instance)
+        with phase(SERIALIZER_PHASE):
+            return super().to_representation(instance)
+
+
+def escape(value):
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+class Histogram:
+    """
+    Гистограмма в формате Prometheus с метками.
+    Для каждого набора меток хранятся счетчики попаданий в интервалы
+    (le - верхняя граница), сумма и число наблюдений.
+    """
+
+    def __init__(self, name, description, labels, buckets):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series = defaultdict(
+            lambda: [[0] * (len(self.buckets) + 1), 0.0]
+        )
+
+    def observe(self, labels, value):
+        counts, _ = series = self.series[labels]
+        counts[bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total) in sorted(self.series.items()):
+            pairs = ','.join(
+                f'{name}="{escape(value)}"'
+                for name, value in zip(self.labels, labels)
+            )
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield (
+                    f'{self.name}_bucket{{{pairs},le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            yield f'{self.name}_sum{{{pairs}}} {total}'
+            yield f'{self.name}_count{{{pairs}}} {cumulative}'
+
+
+class RequestMetrics:
+    """
+    Метрики запросов процесса по маршрутам (имени view в URLconf,
+    для вьюсетов - "<basename>-<action>", например recipes-list):
+    длительность запроса, время фаз и число SQL-запросов.
+    """
+
+    def __init__(self, duration_buckets, query_buckets):
+        self.lock = Lock()
+        self.duration = Histogram(
+            'foodgram_request_duration_seconds',
+            'Длительность обработки запроса.',
+            ('route', 'method', 'status'),
+            duration_buckets
+        )
+        self.phase_duration = Histogram(
+            'foodgram_request_phase_duration_seconds',
+            'Длительность фазы обработки запроса.',
+            ('route', 'phase'),
+            duration_buckets
+        )
+        self.queries = Histogram(
+            'foodgram_request_queries',
+            'Число SQL-запросов при обработке запроса.',
+            ('route',),
+            query_buckets
+        )
+
+    def observe(self, route, method, status, stats, total):
+        with self.lock:
+            self.duration.observe((route, method, str(status)), total)
+            for name, duration in stats.durations.items():
+                self.phase_duration.observe((route, name), duration)
+            self.queries.observe((route,), stats.queries)
+
+    def render(self):
+        """Функция выгрузки метрик в текстовом формате Prometheus."""
+        with self.lock:
+            lines = [
+                *self.duration.render(),
+                *self.phase_duration.render(),
+                *self.queries.render(),
+            ]
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            for histogram in (
+                self.duration, self.phase_duration, self.queries
+            ):
+                histogram.series.clear()
+
+
+request_metrics = RequestMetrics(
+    duration_buckets=settings.METRICS_DURATION_BUCKETS,
+    query_buckets=settings.METRICS_QUERY_BUCKETS
+)
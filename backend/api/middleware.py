@@ -0,0 +1,136 @@
+from cProfile import Profile
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.db import connections
+from django.http import FileResponse
+
+from .metrics import RequestStats, current_stats, request_metrics
+from .profiling import PROFILE_HEADER, request_profiler
+
+
+UNMATCHED_ROUTE = 'unmatched'
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware учета времени обработки запросов.
+    Считает SQL-запросы и время их выполнения (в том числе при передаче
+    потокового ответа), время сериализации и рендеринга, добавляет
+    в ответ заголовок Server-Timing,
+    сохраняет наблюдения в гистограммы маршрута
+    и записывает медленные SQL-запросы в журнал.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats(request)
+        token = current_stats.set(stats)
+        start = perf_counter()
+        try:
+            with self.count_queries(stats):
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        response['Server-Timing'] = stats.server_timing(
+            perf_counter() - start
+        )
+        # Файлы передаются без SQL-запросов и могут отдаваться
+        # сервером напрямую (wsgi.file_wrapper), поэтому не оборачиваются.
+        if response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = self.stream(
+                response.streaming_content,
+                request,
+                response,
+                stats,
+                start
+            )
+        else:
+            self.observe(request, response, stats, start)
+        return response
+
+    @staticmethod
+    @contextmanager
+    def count_queries(stats):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(stats.execute_wrapper)
+                )
+            yield
+
+    def stream(self, content, request, response, stats, start):
+        """
+        Функция передачи содержимого потокового ответа с учетом
+        SQL-запросов, выполненных при его формировании.
+        Наблюдения сохраняются после передачи или закрытия ответа;
+        заголовок Server-Timing содержит только время до передачи.
+        """
+        iterator = iter(content)
+        try:
+            while True:
+                with self.count_queries(stats):
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                yield chunk
+        finally:
+            self.observe(request, response, stats, start)
+
+    @staticmethod
+    def observe(request, response, stats, start):
+        match = request.resolver_match
+        request_metrics.observe(
+            match.view_name if match else UNMATCHED_ROUTE,
+            request.method,
+            response.status_code,
+            stats,
+            perf_counter() - start
+        )
+
+    def process_template_response(self, request, response):
+        stats = current_stats.get()
+        start = perf_counter()
+
+        def rendered(response):
+            stats.durations['render'] += perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Middleware профилирования запросов (cProfile).
+    Профилирует запросы администраторов с заголовком X-Profile: 1
+    (имя файла профиля возвращается в заголовке ответа X-Profile)
+    и выборку остальных запросов (PROFILING_SAMPLE_RATE).
+    Права проверяются до включения профилировщика, поэтому
+    middleware подключается после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = request_profiler.requested(request)
+        if not requested and not request_profiler.sampled():
+            return self.get_response(request)
+        profile = Profile()
+        start = perf_counter()
+        try:
+            profile.enable()
+        except ValueError:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        duration = perf_counter() - start
+        name = request_profiler.save(profile, request, duration)
+        if requested:
+            response[PROFILE_HEADER] = name
+        return response
@@ -0,0 +1,107 @@
+from hashlib import sha1
+from time import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+VERSION_KEY = 'reference-version:{model}'
+RESPONSE_KEY = 'reference-response:{model}:{version}:{request}'
+
+
+def get_reference_version(model):
+    """
+    Функция получения версии справочника и времени его изменения.
+    Версия меняется при каждом сохранении или удалении объекта модели.
+    """
+    key = VERSION_KEY.format(model=model._meta.label_lower)
+    version = cache.get(key)
+    if version is None:
+        version = update_reference_version(model)
+    return version
+
+
+def update_reference_version(model):
+    version = (uuid4().hex, int(time()))
+    cache.set(
+        VERSION_KEY.format(model=model._meta.label_lower),
+        version,
+        timeout=None
+    )
+    return version
+
+
+class ReferenceCacheMixin:
+    """
+    Миксин для вьюсетов справочников (тегов и продуктов).
+    Сериализованные ответы хранятся в кэше до изменения справочника,
+    но не дольше REFERENCE_CACHE_TTL секунд, ответы содержат заголовки
+    ETag и Last-Modified, на условные запросы с совпадающим
+    If-None-Match возвращается 304.
+    Ключ кэша строится из пути и параметров запроса из cache_params
+    (без учета регистра), остальные параметры не учитываются.
+    """
+
+    cache_params = ()
+
+    def get_cache_key(self, request, version):
+        params = '&'.join(
+            f'{name}={request.query_params.get(name, "").lower()}'
+            for name in self.cache_params
+        )
+        return RESPONSE_KEY.format(
+            model=self.queryset.model._meta.label_lower,
+            version=version,
+            request=sha1(f'{request.path}?{params}'.encode()).hexdigest()
+        )
+
+    def cached_response(self, request, get_response):
+        version, modified = get_reference_version(self.queryset.model)
+        key = self.get_cache_key(request, version)
+        cached = cache.get(key)
+        if cached is None:
+            response = get_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cached = (
+                response.data,
+                quote_etag(
+                    sha1(JSONRenderer().render(response.data)).hexdigest()
+                )
+            )
+            cache.set(key, cached, timeout=settings.REFERENCE_CACHE_TTL)
+        data, etag = cached
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=modified
+        ) or Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            lambda: super(ReferenceCacheMixin, self).list(
+                request,
+                *args,
+                **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            lambda: super(ReferenceCacheMixin, self).retrieve(
+                request,
+                *args,
+                **kwargs
+            )
+        )
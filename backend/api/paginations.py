@@ -1,8 +1,262 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+INVALID_CURSOR = 'Неверный курсор!'
+PAGE_NOT_INTEGER = 'Номер страницы должен быть целым числом!'
+PAGE_LESS_THAN_ONE = 'Номер страницы должен быть не меньше 1!'
+PAGE_EMPTY = 'На этой странице нет результатов!'
+
+
+COUNT_CACHE_KEY = 'pagination-count:{table}'
+ESTIMATE_SQL = (
+    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+)
+
+
+class ApiPage(Page):
+    """
+    Страница с наличием следующей страницы, определенным выборкой,
+    а не по числу страниц.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self.next_exists = has_next
+
+    def has_next(self):
+        return self.next_exists
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+
+class ApiPaginator(Paginator):
+    """
+    Пагинатор с выбором способа подсчета записей.
+    - exact: точный подсчет (COUNT(*));
+    - approximate: для запроса без фильтров - оценка планировщика
+      PostgreSQL (pg_class.reltuples) для больших таблиц или точный
+      подсчет, сохраненный в кэше на PAGINATION_COUNT_CACHE_TTL секунд;
+      для запроса с фильтрами - точный подсчет, ограниченный
+      PAGINATION_COUNT_CAP записями.
+    Приближенное число записей только выводится в ответе: номер
+    страницы не ограничивается числом страниц, а наличие следующей
+    страницы определяется выборкой лишней записи.
+    """
+
+    def __init__(self, *args, count_strategy='exact', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_strategy = count_strategy
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        if self.count_strategy == 'exact':
+            return super().count
+        queryset = self.object_list
+        if not queryset.query.where:
+            count, self.count_exact = self.table_count(queryset)
+            return count
+        cap = settings.PAGINATION_COUNT_CAP
+        count = queryset.order_by()[:cap + 1].count()
+        if count > cap:
+            self.count_exact = False
+            return cap
+        return count
+
+    def validate_number(self, number):
+        if self.count_exact:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(PAGE_NOT_INTEGER)
+        if number < 1:
+            raise EmptyPage(PAGE_LESS_THAN_ONE)
+        return number
+
+    def page(self, number):
+        # Подсчет выполняется до проверки номера: он определяет точность.
+        self.count
+        if self.count_exact:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(PAGE_EMPTY)
+        return ApiPage(
+            rows[:self.per_page],
+            number,
+            self,
+            has_next=len(rows) > self.per_page
+        )
+
+    @staticmethod
+    def table_count(queryset):
+        """
+        Функция подсчета записей таблицы: оценка планировщика для больших
+        таблиц, иначе точный подсчет. Возвращает число записей и признак
+        точного подсчета; результат хранится в кэше.
+        Значение из кэша может устареть, поэтому считается приближенным.
+        """
+        table = queryset.model._meta.db_table
+        key = COUNT_CACHE_KEY.format(table=table)
+        count = cache.get(key)
+        if count is not None:
+            return count, False
+        count = -1
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(ESTIMATE_SQL, (table,))
+                count = cursor.fetchone()[0]
+        exact = count < settings.PAGINATION_COUNT_CAP
+        if exact:
+            count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+        return count, exact
 
 
 class ApiPagination(PageNumberPagination):
-    """Класс кастомной пагинации."""
+    """
+    Класс кастомной пагинации.
+    Способ подсчета записей для вьюсета задается настройкой
+    PAGINATION_COUNT по имени вьюсета (basename).
+    """
 
     page_size_query_param = 'limit'
     page_size = 6
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_strategies = settings.PAGINATION_COUNT
+        self.django_paginator_class = partial(
+            ApiPaginator,
+            count_strategy=count_strategies.get(
+                getattr(view, 'basename', None),
+                count_strategies['DEFAULT']
+            )
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        paginator = self.page.paginator
+        if paginator.count_strategy == 'approximate':
+            response.data['count_exact'] = paginator.count_exact
+        return response
+
+
+class ApiCursorPagination(ApiPagination):
+    """
+    Класс пагинации с дополнительным режимом курсора (keyset).
+    Режим включается параметром запроса "cursor" (пустым для первой
+    страницы) и не выполняет подсчет записей и пропуск строк (OFFSET):
+    следующая страница выбирается по значениям полей сортировки
+    последней записи с уточнением по id (сортировка может включать
+    аннотации, например релевантность поиска).
+    Без параметра "cursor" работает постраничная пагинация.
+    """
+
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.cursor_mode = False
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_mode = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.ordering = (
+            *(queryset.query.order_by or queryset.model._meta.ordering),
+            'id'
+        )
+        queryset = queryset.order_by(*self.ordering)
+        self.annotations = set(queryset.query.annotations)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(position))
+            except (DjangoValidationError, TypeError, ValueError):
+                raise NotFound(INVALID_CURSOR)
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = self.get_position(page[-1])
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            urlsafe_b64encode(
+                json.dumps(self.next_position).encode()
+            ).decode()
+        )
+
+    def get_position(self, instance):
+        return [
+            getattr(instance, name) if name in self.annotations
+            else instance._meta.get_field(name).value_to_string(instance)
+            for name in (field.lstrip('-') for field in self.ordering)
+        ]
+
+    def decode_cursor(self, request):
+        cursor = request.query_params[self.cursor_query_param]
+        if not cursor:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound(INVALID_CURSOR)
+        if (
+            not isinstance(position, list)
+            or len(position) != len(self.ordering)
+        ):
+            raise NotFound(INVALID_CURSOR)
+        return position
+
+    def after(self, position):
+        """
+        Функция построения условия выборки записей,
+        следующих за позицией курсора в порядке сортировки.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
@@ -0,0 +1,93 @@
+import re
+from datetime import datetime
+from pathlib import Path
+from random import random
+from uuid import uuid4
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .slow_queries import view_action
+
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SUFFIX = '.prof'
+PROFILE_NAME = re.compile(
+    r'^(?P<time>\d{8}T\d{6})_(?P<view>[\w-]+)\.(?P<action>[\w-]+)_'
+    r'(?P<duration>\d+)ms_[0-9a-f]+\.prof$'
+)
+UNMATCHED_VIEW = 'unmatched'
+
+
+class RequestProfiler:
+    """
+    Хранилище профилей cProfile отдельных запросов.
+    Профилируются запросы администраторов с заголовком X-Profile: 1
+    и доля sample_rate остальных запросов.
+    Профиль сохраняется в файл вида
+    <время>_<вьюсет>.<действие>_<длительность>ms_<id>.prof,
+    в каталоге хранится не более max_files последних профилей.
+    """
+
+    def __init__(self, directory, sample_rate, max_files):
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+
+    @staticmethod
+    def requested(request):
+        """
+        Функция проверки запроса профиля администратором.
+        Пользователь определяется по сессии или токену
+        до выполнения запроса.
+        """
+        if request.headers.get(PROFILE_HEADER) != '1':
+            return False
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        try:
+            authenticated = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
+
+    def sampled(self):
+        return random() < self.sample_rate
+
+    def save(self, profile, request, duration):
+        _, view, action = view_action(request)
+        view = view.rsplit('.', 1)[-1] if view else UNMATCHED_VIEW
+        name = (
+            f'{datetime.now():%Y%m%dT%H%M%S}_{view}.{action or "-"}_'
+            f'{round(duration * 1000)}ms_{uuid4().hex[:8]}{PROFILE_SUFFIX}'
+        )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(self.directory / name)
+        self.prune()
+        return name
+
+    def prune(self):
+        for path in self.files()[self.max_files:]:
+            path.unlink(missing_ok=True)
+
+    def files(self):
+        """Функция получения файлов профилей (новые первыми)."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (
+                path for path in self.directory.iterdir()
+                if PROFILE_NAME.match(path.name)
+            ),
+            key=lambda path: path.name,
+            reverse=True
+        )
+
+
+request_profiler = RequestProfiler(
+    directory=settings.PROFILING_DIR,
+    sample_rate=settings.PROFILING_SAMPLE_RATE,
+    max_files=settings.PROFILING_MAX_FILES
+)
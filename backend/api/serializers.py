@@ -1,18 +1,45 @@
+import binascii
+from base64 import b64decode
+from collections import Counter
+from uuid import uuid4
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.core.files.uploadedfile import (
+    TemporaryUploadedFile,
+    UploadedFile
+)
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserSerializer as UserSerializerBase
-from drf_extra_fields.fields import Base64ImageField
-from rest_framework import status
+from PIL import Image, UnidentifiedImageError
 from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import (
     CurrentUserDefault,
+    Field,
+    ImageField,
     IntegerField,
+    ListField,
     ModelSerializer,
-    PrimaryKeyRelatedField,
     ReadOnlyField,
+    Serializer,
     SerializerMethodField
 )
 
+from .memberships import memberships
+from .metrics import TimedSerializerMixin
+from .utils import (
+    add_recent_recipes,
+    change_shopping_lists,
+    subscribed_authors
+)
+from recipes.images import (
+    DERIVATIVE_FORMATS,
+    INGEST_FORMATS,
+    downscale_image,
+    max_pixels,
+    schedule_derivatives
+)
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -22,6 +49,7 @@ from recipes.models import (
     Subscribe,
     Tag
 )
+from recipes.search import update_search_vectors
 
 
 User = get_user_model()
@@ -29,26 +57,137 @@ User = get_user_model()
 
 INGREDIENTS_NEED = 'Необходимо добавить хотя бы один продукт!'
 INGREDIENT_REPEAT = 'Продукты {elements} повторяется!'
+INGREDIENT_MISSING = 'Продукты с id {ids} не найдены!'
 INGREDIENT_AMOUNT = (
     'Мера продукта {ingredient} должна быть не менее 1. Сейчас - {amount}!'
 )
 
 TAGS_NEED = 'Необходимо добавить хотя бы один тег!'
 TAG_REPEAT = 'Теги {elements} повторяются!'
+TAG_MISSING = 'Теги с id {ids} не найдены!'
 
-IS_SUBSCRIBED_IS_TRUE = (
-    'Пользователь {user} уже подписан на пользователя {author}!'
-)
-IS_SUBSCRIBED_IS_FALSE = (
-    'Пользователь {user} не подписан на пользователя {author}!'
-)
-IS_SUBSCRIBED_FOR_NO_AUTHOR = (
-    'Пользователь {user} не может подписываться на самого себя!'
-)
 IMAGE_IS_REQUIRED = 'Изображение обязательно!'
+IMAGE_INVALID = 'Загрузите корректное изображение (JPEG, PNG, GIF, WebP)!'
+IMAGE_TOO_LARGE = 'Размер изображения не должен превышать {limit} байт!'
+IMAGE_TOO_MANY_PIXELS = (
+    'Изображение не должно содержать более {limit} пикселей!'
+)
+
+BASE64_CHUNK_SIZE = 64 * 1024
 
 
-class UserSerializer(UserSerializerBase):
+class RecipeImageField(ImageField):
+    """
+    Поле изображения рецепта.
+    Принимает файл multipart-запроса или строку base64 (data URI),
+    которая декодируется частями во временный файл.
+    До полного декодирования проверяются размер файла (MAX_IMAGE_BYTES)
+    и число пикселей по заголовку (MAX_IMAGE_PIXELS для JPEG,
+    MAX_DECODED_IMAGE_PIXELS для остальных форматов), изображения
+    со стороной больше MAX_IMAGE_SIDE уменьшаются.
+    """
+
+    def to_internal_value(self, data):
+        is_base64 = isinstance(data, str)
+        if is_base64:
+            data = self.decode_base64(data)
+        elif not isinstance(data, UploadedFile):
+            raise ValidationError(IMAGE_INVALID)
+        if data.size > settings.MAX_IMAGE_BYTES:
+            raise ValidationError(
+                IMAGE_TOO_LARGE.format(limit=settings.MAX_IMAGE_BYTES)
+            )
+        image_format = self.read_format(data)
+        if is_base64:
+            data.name = f'{uuid4().hex}.{image_format.lower()}'
+        return downscale_image(super().to_internal_value(data), image_format)
+
+    @staticmethod
+    def decode_base64(data):
+        if ';base64,' in data:
+            data = data.split(';base64,', 1)[1]
+        # Переносы строк в base64 сдвигают границы частей декодирования.
+        data = ''.join(data.split())
+        if len(data) // 4 * 3 > settings.MAX_IMAGE_BYTES:
+            raise ValidationError(
+                IMAGE_TOO_LARGE.format(limit=settings.MAX_IMAGE_BYTES)
+            )
+        upload = TemporaryUploadedFile('image', None, 0, None)
+        try:
+            for start in range(0, len(data), BASE64_CHUNK_SIZE):
+                upload.write(
+                    b64decode(data[start:start + BASE64_CHUNK_SIZE])
+                )
+        except (binascii.Error, ValueError):
+            upload.close()
+            raise ValidationError(IMAGE_INVALID)
+        upload.size = upload.tell()
+        upload.seek(0)
+        return upload
+
+    @staticmethod
+    def read_format(upload):
+        """
+        Функция проверки формата и числа пикселей изображения
+        по заголовку файла без декодирования.
+        """
+        try:
+            with Image.open(upload) as image:
+                image_format = image.format
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width = height = settings.MAX_IMAGE_PIXELS
+            image_format = None
+        except (UnidentifiedImageError, OSError):
+            raise ValidationError(IMAGE_INVALID)
+        finally:
+            upload.seek(0)
+        limit = max_pixels(image_format)
+        if width * height > limit:
+            raise ValidationError(IMAGE_TOO_MANY_PIXELS.format(limit=limit))
+        if image_format not in INGEST_FORMATS:
+            raise ValidationError(IMAGE_INVALID)
+        return image_format
+
+
+class ImageDerivativesField(Field):
+    """
+    Поле ссылок на уменьшенные копии изображения рецепта
+    по форматам и ширинам.
+    Пока копии не созданы, ссылки ведут на исходное изображение.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        storage = recipe.image.storage
+
+        def url(name):
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+
+        original = url(recipe.image.name)
+        return {
+            image_format: {
+                str(width): (
+                    url(recipe.image_derivatives[image_format][str(width)])
+                    if str(width) in recipe.image_derivatives.get(
+                        image_format,
+                        {}
+                    )
+                    else original
+                )
+                for width in settings.IMAGE_DERIVATIVE_WIDTHS
+            }
+            for image_format in DERIVATIVE_FORMATS
+        }
+
+
+class UserSerializer(TimedSerializerMixin, UserSerializerBase):
     """Сериализатор для модели пользователя."""
 
     is_subscribed = SerializerMethodField()
@@ -61,23 +200,27 @@ class UserSerializer(UserSerializerBase):
         )
 
     def get_is_subscribed(self, author):
-        user = self.context.get('request').user
-        return (
-            not user.is_anonymous and Subscribe.objects.filter(
-                user=user,
-                author=author
-            ).exists()
-        )
+        request = self.context.get('request')
+        user = request.user
+        if user.is_anonymous or user.pk == author.pk:
+            return False
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        authors = memberships.for_request(request)[Subscribe]
+        if authors is not None:
+            return author.pk in authors
+        return Subscribe.objects.filter(user=user, author=author).exists()
 
 
 class SubscribeReadSerializer(UserSerializer):
-    """Сериализатор для чтения подписки."""
+    """
+    Сериализатор для чтения подписки.
+    Ожидает авторов, подготовленных функциями subscribed_authors
+    и add_recent_recipes.
+    """
 
     recipes = SerializerMethodField()
-    recipes_count = IntegerField(
-        source='recipes.count',
-        read_only=True
-    )
+    recipes_count = IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = (
@@ -88,60 +231,29 @@ class SubscribeReadSerializer(UserSerializer):
         read_only_fields = ('__all__',)
 
     def get_recipes(self, author):
-        request = self.context.get('request')
-        limit = int(request.GET.get('recipes_limit', 10**10))
         return RecipeSubscribeSerializer(
-            author.recipes.all()[:limit],
+            author.recent_recipes,
             many=True,
-            context={'request': request}
+            context=self.context
         ).data
 
 
-class SubscribeSerializer(ModelSerializer):
-    """Сериализатор для создания и удаления подписки."""
+class SubscribeSerializer(TimedSerializerMixin, ModelSerializer):
+    """Сериализатор для вывода созданной подписки."""
 
     class Meta:
         model = Subscribe
         fields = ('user', 'author')
 
-    def validate(self, data):
-        request = self.context.get('request')
-        author = data.get('author')
-        user = request.user
-        if user == author:
-            raise ValidationError(
-                detail=IS_SUBSCRIBED_FOR_NO_AUTHOR.format(
-                    user=user.username
-                ),
-                code=status.HTTP_400_BAD_REQUEST
-            )
-        if Subscribe.objects.filter(author=author, user=user).exists():
-            if request.method == 'POST':
-                raise ValidationError(
-                    detail=IS_SUBSCRIBED_IS_TRUE.format(
-                        user=user.username,
-                        author=author.username
-                    ),
-                    code=status.HTTP_400_BAD_REQUEST
-                )
-        if request.method == 'DEL':
-            raise ValidationError(
-                detail=IS_SUBSCRIBED_IS_FALSE.format(
-                    user=user.username,
-                    author=author.username
-                ),
-                code=status.HTTP_400_BAD_REQUEST
-            )
-        return data
-
     def to_representation(self, subscribe):
-        return SubscribeReadSerializer(
-            subscribe.get('author'),
-            context=self.context
-        ).data
+        [author] = add_recent_recipes(
+            subscribed_authors(User.objects.filter(pk=subscribe.author_id)),
+            self.context.get('recipes_limit')
+        )
+        return SubscribeReadSerializer(author, context=self.context).data
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатор для модели тега."""
 
     class Meta:
@@ -150,7 +262,7 @@ class TagSerializer(ModelSerializer):
         read_only_fields = ('__all__',)
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатора для модели продукта."""
 
     class Meta:
@@ -159,7 +271,7 @@ class IngredientSerializer(ModelSerializer):
         read_only_fields = ('__all__',)
 
 
-class IngredientRecipeSerializer(ModelSerializer):
+class IngredientRecipeSerializer(TimedSerializerMixin, ModelSerializer):
     """
     Сериализатор для модели продукта для рецепта
     (связанной модели продукта и рецепта).
@@ -178,8 +290,9 @@ class AddIngredientInRecipeSerializer(ModelSerializer):
     """
     Сериализатор для поля "ingredient" модели рецепта (Recipe)
     при создании рецепта.
+    Продукты проверяются одним запросом в RecipeSerializer.
     """
-    id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = IntegerField()
     amount = IntegerField()
 
     class Meta:
@@ -187,11 +300,12 @@ class AddIngredientInRecipeSerializer(ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeSerializerBase(ModelSerializer):
+class RecipeSerializerBase(TimedSerializerMixin, ModelSerializer):
     """Базовый сериализатор для модели рецепта."""
 
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
+    images = ImageDerivativesField()
 
     class Meta:
         model = Recipe
@@ -202,6 +316,7 @@ class RecipeSerializerBase(ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
             'is_favorited',
@@ -209,15 +324,32 @@ class RecipeSerializerBase(ModelSerializer):
         )
         read_only_fields = ('__all__',)
 
+    def check_recipe_for_user(self, model, recipe, annotation):
+        """
+        Функция проверки наличия рецепта в списке текущего пользователя.
+        Использует аннотацию запроса, если она есть, иначе - кэш
+        множеств пользователя.
+        """
+        request = self.context.get('request')
+        user = request.user
+        if user.is_anonymous:
+            return False
+        if hasattr(recipe, annotation):
+            return getattr(recipe, annotation)
+        recipes = memberships.for_request(request)[model]
+        if recipes is not None:
+            return recipe.pk in recipes
+        return model.objects.filter(user=user, recipe=recipe).exists()
+
     def get_is_favorited(self, recipe):
-        return (
-            not self.context.get('request').user.is_anonymous
-            and Favorite.objects.filter(recipe=recipe).exists()
-        )
+        return self.check_recipe_for_user(Favorite, recipe, 'is_favorited')
 
     def get_is_in_shopping_cart(self, recipe):
-        return (not self.context.get('request').user.is_anonymous
-                and ShoppingCart.objects.filter(recipe=recipe).exists())
+        return self.check_recipe_for_user(
+            ShoppingCart,
+            recipe,
+            'is_in_shopping_cart'
+        )
 
 
 class RecipeReadSerializer(RecipeSerializerBase):
@@ -240,11 +372,8 @@ class RecipeSerializer(RecipeSerializerBase):
         many=True,
         write_only=True
     )
-    tags = PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
-    image = Base64ImageField(required=True)
+    tags = ListField(child=IntegerField())
+    image = RecipeImageField(required=True)
     author = UserSerializer(default=CurrentUserDefault())
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
@@ -263,18 +392,22 @@ class RecipeSerializer(RecipeSerializerBase):
         )
 
     @staticmethod
-    def check_duplicate(check_list, message, key):
-        elements_list_duplicate = [
-            (element.name if not key else element.get(key).name)
-            for element in check_list if check_list.count(element) > 1
-        ]
-        if elements_list_duplicate:
-            raise ValidationError(
-                {'field': message.format(
-                    elements=set(elements_list_duplicate)
-                )}
-            )
-        return check_list
+    def find_objects(model, ids, not_found_message):
+        """
+        Функция получения объектов модели по списку id одним запросом.
+        Возвращает словарь объектов и список ошибок:
+        об отсутствующих и повторяющихся объектах.
+        """
+        objects = model.objects.in_bulk(ids)
+        errors = []
+        missing = [id for id in dict.fromkeys(ids) if id not in objects]
+        if missing:
+            errors.append(not_found_message.format(ids=missing))
+        return objects, errors
+
+    @staticmethod
+    def find_duplicates(ids):
+        return [id for id, count in Counter(ids).items() if count > 1]
 
     def validate_image(self, image):
         if image:
@@ -283,71 +416,169 @@ class RecipeSerializer(RecipeSerializerBase):
 
     def validate_ingredients(self, ingredients):
         if not ingredients:
-            raise ValidationError({'ingredients': INGREDIENTS_NEED})
-        for unit_ingredient in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient,
-                id=unit_ingredient['id'].id
+            raise ValidationError(INGREDIENTS_NEED)
+        ids = [ingredient['id'] for ingredient in ingredients]
+        found, errors = self.find_objects(Ingredient, ids, INGREDIENT_MISSING)
+        duplicates = self.find_duplicates(ids)
+        if duplicates:
+            errors.append(INGREDIENT_REPEAT.format(elements={
+                found[id].name if id in found else id for id in duplicates
+            }))
+        errors.extend(
+            INGREDIENT_AMOUNT.format(
+                ingredient=(
+                    found[ingredient['id']].name
+                    if ingredient['id'] in found else ingredient['id']
+                ),
+                amount=ingredient['amount']
             )
-            amount = int(unit_ingredient['amount'])
-            if amount < 1:
-                raise ValidationError(
-                    {'ingredients': INGREDIENT_AMOUNT.format(
-                        ingredient=ingredient.name,
-                        amount=amount
-                    )}
-                )
-        ingredients = self.check_duplicate(
-            ingredients,
-            INGREDIENT_REPEAT,
-            'id'
+            for ingredient in ingredients if ingredient['amount'] < 1
         )
-        return ingredients
+        if errors:
+            raise ValidationError(errors)
+        return [
+            {'id': found[ingredient['id']], 'amount': ingredient['amount']}
+            for ingredient in ingredients
+        ]
 
     def validate_tags(self, tags):
         if not tags:
-            raise ValidationError({'tags': TAGS_NEED})
-        tags = self.check_duplicate(tags, TAG_REPEAT, '')
-        return tags
+            raise ValidationError(TAGS_NEED)
+        found, errors = self.find_objects(Tag, tags, TAG_MISSING)
+        duplicates = self.find_duplicates(tags)
+        if duplicates:
+            errors.append(TAG_REPEAT.format(elements={
+                found[id].name if id in found else id for id in duplicates
+            }))
+        if errors:
+            raise ValidationError(errors)
+        return [found[id] for id in tags]
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            (instance,),
+            'tags',
+            Prefetch(
+                'ingredients_recipes',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            )
+        )
         return RecipeReadSerializer(
             instance,
             context=self.context
         ).data
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = super().create(validated_data)
+        validated_data['image'].close()
         self.add_ingredients(ingredients, recipe)
         recipe.tags.set(tags)
+        update_search_vectors(Recipe.objects.filter(pk=recipe.pk))
+        schedule_derivatives(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        if self.validate_ingredients(validated_data.get('ingredients')):
-            ingredients = validated_data.pop('ingredients')
-        if self.validate_tags(validated_data.get('tags')):
-            tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        self.add_ingredients(ingredients, instance)
-        instance.tags.set(tags)
-        return super().update(instance, validated_data)
+        """
+        Функция обновления рецепта.
+        Продукты и теги меняются, только если переданы в запросе,
+        и только в отличающейся части.
+        """
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        if tags is not None:
+            instance.tags.set(tags)
+        if 'image' in validated_data:
+            validated_data['image_derivatives'] = {}
+        recipe = super().update(instance, validated_data)
+        if (
+            ingredients is not None
+            or validated_data.keys() & {'name', 'text'}
+        ):
+            update_search_vectors(Recipe.objects.filter(pk=recipe.pk))
+        if 'image' in validated_data:
+            validated_data['image'].close()
+            schedule_derivatives(recipe)
+        return recipe
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """
+        Функция изменения продуктов рецепта по разнице с текущими:
+        новые продукты добавляются, измененные меры обновляются,
+        отсутствующие продукты удаляются (не более одного запроса
+        на каждое действие).
+        Изменения мер переносятся в списки покупок пользователей.
+        """
+        current = {
+            ingredient_recipe.ingredient_id: ingredient_recipe
+            for ingredient_recipe in IngredientRecipe.objects.filter(
+                recipe=recipe
+            )
+        }
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        shopping_list_changes = {
+            ingredient: amounts.get(ingredient, 0) - (
+                current[ingredient].amount if ingredient in current else 0
+            )
+            for ingredient in {*current, *amounts}
+        }
+        changed = []
+        for ingredient, ingredient_recipe in current.items():
+            if ingredient in amounts and (
+                amounts[ingredient] != ingredient_recipe.amount
+            ):
+                ingredient_recipe.amount = amounts[ingredient]
+                changed.append(ingredient_recipe)
+        removed = current.keys() - amounts.keys()
+        RecipeSerializer.add_ingredients(
+            [
+                ingredient for ingredient in ingredients
+                if ingredient['id'].id not in current
+            ],
+            recipe
+        )
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe,
+                ingredient__in=removed
+            ).delete()
+        change_shopping_lists(
+            ShoppingCart.objects.filter(
+                recipe=recipe
+            ).values_list('user', flat=True),
+            shopping_list_changes
+        )
 
 
-class RecipeSubscribeSerializer(ModelSerializer):
+class RecipeSubscribeSerializer(TimedSerializerMixin, ModelSerializer):
     """
     Сериализатор для модели рецепта (Recipe)
     при выводе в списке рецептов в подписках списках избранного и покупок
     текущего пользователя.
     """
 
+    images = ImageDerivativesField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
-class FavoriteAndShoppingCartSerializerBase(ModelSerializer):
+class FavoriteAndShoppingCartSerializerBase(
+    TimedSerializerMixin,
+    ModelSerializer
+):
     """
     Базовый сериализатор
     для модели избранных рецептов пользователя (Favorite)
@@ -376,3 +607,16 @@ class ShoppingCartSerializer(FavoriteAndShoppingCartSerializerBase):
 
     class Meta(FavoriteAndShoppingCartSerializerBase.Meta):
         model = ShoppingCart
+
+
+class BulkIdsSerializer(Serializer):
+    """
+    Сериализатор списка id рецептов или авторов
+    для массового добавления и удаления.
+    """
+
+    ids = ListField(
+        child=IntegerField(),
+        allow_empty=False,
+        max_length=settings.MAX_BULK_SIZE
+    )
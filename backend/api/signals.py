@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .ingredient_index import ingredient_index
+from .mixins import update_reference_version
+from .tag_index import tag_index
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import update_search_vectors
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """Функция сброса индекса продуктов при изменении продукта."""
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search_vectors(instance, created, **kwargs):
+    """
+    Функция пересчета поисковых векторов рецептов
+    при изменении названия продукта.
+    """
+    if not created:
+        update_search_vectors(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_index(**kwargs):
+    """Функция сброса индекса тегов при изменении тега."""
+    tag_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_reference_cache(sender, **kwargs):
+    """Функция сброса кэша ответов справочника при его изменении."""
+    update_reference_version(sender)
@@ -0,0 +1,175 @@
+import json
+import logging
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock
+from traceback import extract_stack
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ('SELECT', 'WITH')
+IGNORED_PATHS = (
+    'site-packages',
+    'dist-packages',
+    __file__,
+    str(Path(__file__).with_name('metrics.py')),
+    str(Path(__file__).with_name('middleware.py')),
+)
+SINK_ERROR = 'Не удалось записать медленный запрос в {path}.'
+REDACTED = '***'
+
+
+def call_site():
+    """
+    Функция определения места вызова запроса в коде проекта:
+    ближайший к запросу кадр стека из каталога проекта.
+    """
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(extract_stack()):
+        if frame.filename.startswith(base_dir) and not any(
+            path in frame.filename for path in IGNORED_PATHS
+        ):
+            return (
+                f'{Path(frame.filename).relative_to(base_dir)}:'
+                f'{frame.lineno} in {frame.name}'
+            )
+    return None
+
+
+def view_action(request):
+    """Функция определения маршрута, класса view и действия запроса."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None, None, None
+    view = getattr(match.func, 'cls', match.func)
+    actions = getattr(match.func, 'actions', None) or {}
+    return (
+        match.view_name,
+        f'{view.__module__}.{view.__qualname__}',
+        actions.get(request.method.lower(), request.method.lower())
+    )
+
+
+class SlowQueryLog:
+    """
+    Журнал медленных SQL-запросов в памяти процесса.
+    Хранит последние size запросов, выполнявшихся дольше threshold
+    секунд, с планом выполнения (EXPLAIN, при analyze -
+    EXPLAIN ANALYZE), маршрутом, view и действием, местом вызова.
+    При заданном sink записи дописываются в файл в формате JSONL.
+    Параметры запросов (токены, email, хэши паролей) сохраняются
+    только при log_params, иначе они скрываются и в плане.
+    """
+
+    def __init__(self, threshold, size, analyze=False, sink=None,
+                 log_params=False):
+        self.threshold = threshold
+        self.analyze = analyze
+        self.sink = sink
+        self.log_params = log_params
+        self.records = deque(maxlen=size)
+        self.lock = Lock()
+        self.explaining = ContextVar('explaining', default=False)
+
+    def is_slow(self, duration):
+        return self.threshold is not None and duration >= self.threshold
+
+    def explain(self, connection, sql, params):
+        """
+        Функция получения плана выполнения запроса.
+        План запрашивается в точке сохранения, чтобы ошибка
+        не прервала транзакцию запроса.
+        """
+        if (
+            not connection.features.supports_explaining_query_execution
+            or not sql.lstrip().upper().startswith(EXPLAINABLE)
+        ):
+            return None
+        options = {'analyze': True} if self.analyze else {}
+        try:
+            prefix = connection.ops.explain_query_prefix(**options)
+        except ValueError:
+            prefix = connection.ops.explain_query_prefix()
+        token = self.explaining.set(True)
+        try:
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(f'{prefix} {sql}', params)
+                    rows = cursor.fetchall()
+        except DatabaseError as error:
+            return f'EXPLAIN: {error}'
+        finally:
+            self.explaining.reset(token)
+        return '\n'.join(
+            row[0] if len(row) == 1 else ' '.join(map(str, row))
+            for row in rows
+        )
+
+    @staticmethod
+    def redact(plan, params):
+        """
+        Функция скрытия строковых параметров в плане: драйвер PostgreSQL
+        подставляет значения в текст запроса, и они попадают в план.
+        """
+        for value in params or ():
+            if isinstance(value, str) and value:
+                plan = plan.replace(value, REDACTED)
+        return plan
+
+    def capture(self, connection, sql, params, duration, request):
+        route, view, action = view_action(request)
+        plan = self.explain(connection, sql, params)
+        if not self.log_params:
+            if plan is not None:
+                plan = self.redact(plan, params)
+            params = REDACTED
+        record = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round(duration * 1000, 1),
+            'database': connection.alias,
+            'route': route,
+            'view': view,
+            'action': action,
+            'call_site': call_site(),
+            'sql': sql,
+            'params': params,
+            'plan': plan,
+        }
+        with self.lock:
+            self.records.append(record)
+            if self.sink:
+                self.write(record)
+
+    def write(self, record):
+        try:
+            with open(self.sink, 'a', encoding='utf-8') as sink:
+                sink.write(
+                    json.dumps(record, ensure_ascii=False, default=str)
+                    + '\n'
+                )
+        except OSError:
+            logger.exception(SINK_ERROR.format(path=self.sink))
+
+    def get_records(self):
+        """Функция выборки записей журнала (новые первыми)."""
+        with self.lock:
+            return list(reversed(self.records))
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+
+slow_query_log = SlowQueryLog(
+    threshold=settings.SLOW_QUERY_THRESHOLD,
+    size=settings.SLOW_QUERY_LOG_SIZE,
+    analyze=settings.SLOW_QUERY_EXPLAIN_ANALYZE,
+    sink=settings.SLOW_QUERY_LOG_FILE,
+    log_params=settings.SLOW_QUERY_LOG_PARAMS
+)
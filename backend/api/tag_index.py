@@ -0,0 +1,53 @@
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+
+from .mixins import get_reference_version
+from recipes.models import Tag
+
+
+class TagIndex:
+    """
+    Соответствие слагов тегов их id в памяти процесса.
+    Соответствие перестраивается после изменения тегов (в том числе
+    в другом процессе - по версии справочника в кэше)
+    и не реже одного раза в ttl секунд.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = Lock()
+        self.built_at = None
+        self.version = None
+        self.ids = {}
+
+    def build(self):
+        self.version = get_reference_version(Tag)
+        self.ids = dict(Tag.objects.values_list('slug', 'id').order_by())
+        self.built_at = monotonic()
+
+    def invalidate(self):
+        self.built_at = None
+
+    def ensure_built(self):
+        version = get_reference_version(Tag)
+        with self.lock:
+            if (
+                self.built_at is None
+                or self.version != version
+                or monotonic() - self.built_at > self.ttl
+            ):
+                self.build()
+            return self.ids
+
+    def slugs(self):
+        return sorted(self.ensure_built())
+
+    def get_ids(self, slugs):
+        """Функция получения id тегов по слагам."""
+        ids = self.ensure_built()
+        return {ids[slug] for slug in slugs if slug in ids}
+
+
+tag_index = TagIndex(ttl=settings.TAG_INDEX_TTL)
@@ -0,0 +1,115 @@
+import random
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Subscribe,
+    Tag
+)
+
+
+User = get_user_model()
+
+BATCH_SIZE = 2000
+
+
+def seed_dataset(users=20, recipes=100, ingredients=100, tags=6,
+                 ingredients_per_recipe=5, relations_per_user=10, seed=0):
+    """
+    Функция заполнения БД тестовыми данными: пользователи, теги,
+    продукты, рецепты с продуктами и тегами, подписки, избранное
+    и списки покупок. Данные определяются параметром seed.
+    Возвращает список пользователей.
+    """
+    rng = random.Random(seed)
+    User.objects.bulk_create(
+        (
+            User(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password='!'
+            )
+            for number in range(users)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    users = list(User.objects.order_by('pk'))
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {number}', color='#E26C2D', slug=f'tag{number}')
+        for number in range(tags)
+    )
+    tags = list(Tag.objects.order_by('pk'))
+    Ingredient.objects.bulk_create(
+        (
+            Ingredient(name=f'продукт {number}', measurement_unit='г')
+            for number in range(ingredients)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    ingredients = list(Ingredient.objects.order_by('pk'))
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author=rng.choice(users),
+                name=f'Рецепт {number}',
+                text=f'Описание рецепта {number}',
+                cooking_time=rng.randint(1, 120),
+                image='recipe/images/seed.png'
+            )
+            for number in range(recipes)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    recipes = list(Recipe.objects.order_by('pk'))
+    IngredientRecipe.objects.bulk_create(
+        (
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient=ingredient,
+                amount=rng.randint(1, 500)
+            )
+            for recipe in recipes
+            for ingredient in rng.sample(ingredients, ingredients_per_recipe)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, 2)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    for model, targets, field in (
+        (Subscribe, users, 'author'),
+        (Favorite, recipes, 'recipe'),
+        (ShoppingCart, recipes, 'recipe'),
+    ):
+        model.objects.bulk_create(
+            (
+                model(user=user, **{field: target})
+                for user in users
+                for target in rng.sample(targets, relations_per_user)
+                if target != user
+            ),
+            batch_size=BATCH_SIZE
+        )
+    if connection.vendor == 'postgresql':
+        # Статистика таблиц могла остаться от предыдущих тестов, когда
+        # таблицы были пустыми: с ней пересчет списков покупок выбирает
+        # вложенные циклы без индексов и выполняется минутами.
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    call_command('rebuild_shopping_lists', stdout=StringIO())
+    return users
@@ -0,0 +1,89 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .fixtures import seed_dataset
+from api.utils import (
+    BULK_ABSENT,
+    BULK_CREATED,
+    BULK_DELETED,
+    BULK_EXISTS,
+    BULK_NOT_FOUND
+)
+from recipes.models import Subscribe
+
+
+class BulkSubscribeTest(TestCase):
+    """
+    Проверка результатов массовой подписки и отписки: статус каждого
+    автора соответствует выполненной записи.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_dataset(
+            users=6,
+            recipes=10,
+            ingredients=10,
+            tags=2,
+            relations_per_user=3
+        )
+        cls.user = cls.users[0]
+        Subscribe.objects.filter(user=cls.user).delete()
+        cls.subscribed, cls.author = cls.users[1:3]
+        Subscribe.objects.create(user=cls.user, author=cls.subscribed)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bulk(self, method, ids):
+        response = getattr(self.client, method)(
+            '/api/users/subscribe/',
+            {'ids': ids},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            result['id']: result['status']
+            for result in response.data['results']
+        }
+
+    def authors(self):
+        return set(
+            Subscribe.objects.filter(
+                user=self.user
+            ).values_list('author_id', flat=True)
+        )
+
+    def test_subscribe(self):
+        missing = max(user.pk for user in self.users) + 1
+        self.assertEqual(
+            self.bulk('post', [
+                self.subscribed.pk,
+                self.author.pk,
+                self.user.pk,
+                missing
+            ]),
+            {
+                self.subscribed.pk: BULK_EXISTS,
+                self.author.pk: BULK_CREATED,
+                self.user.pk: BULK_NOT_FOUND,
+                missing: BULK_NOT_FOUND,
+            }
+        )
+        self.assertEqual(self.authors(), {self.subscribed.pk, self.author.pk})
+        self.assertEqual(
+            self.bulk('post', [self.author.pk]),
+            {self.author.pk: BULK_EXISTS}
+        )
+
+    def test_unsubscribe(self):
+        self.assertEqual(
+            self.bulk('delete', [self.subscribed.pk, self.author.pk]),
+            {self.subscribed.pk: BULK_DELETED, self.author.pk: BULK_ABSENT}
+        )
+        self.assertEqual(self.authors(), set())
+        self.assertEqual(
+            self.bulk('delete', [self.subscribed.pk]),
+            {self.subscribed.pk: BULK_ABSENT}
+        )
@@ -0,0 +1,147 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Subscribe,
+    Tag,
+    User
+)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+SEED = 7
+GENERATE_OPTIONS = {
+    'users': 15,
+    'recipes': 40,
+    'favorites': 4,
+    'cart': 2,
+    'subscriptions': 3,
+    'seed': SEED,
+}
+TAGS = (
+    'name,color,slug\n'
+    'Завтрак,#E26C2D,breakfast\n'
+    'Обед,#49B64E,lunch\n'
+)
+
+
+def run(command, *args, **options):
+    output = StringIO()
+    call_command(command, *args, stdout=output, stderr=StringIO(), **options)
+    return output.getvalue()
+
+
+class LoadReferencesTest(TestCase):
+    """
+    Проверка повторной загрузки справочников: повторный запуск
+    не добавляет записей, измененные записи обновляются.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.tags = f'{directory}/tags.csv'
+        with open(self.tags, 'w', encoding='utf-8') as file:
+            file.write(TAGS)
+
+    def counts(self):
+        return Ingredient.objects.count(), Tag.objects.count()
+
+    def test_load_twice(self):
+        run('load_references')
+        counts = self.counts()
+        self.assertGreater(min(counts), 0)
+        output = run('load_references')
+        self.assertEqual(self.counts(), counts)
+        self.assertEqual(output.count('добавлено 0, обновлено 0'), 2)
+
+    def test_changed_rows_updated(self):
+        run('load_references', tags=self.tags)
+        with open(self.tags, 'w', encoding='utf-8') as file:
+            file.write(TAGS.replace('#49B64E', '#000000'))
+        output = run('load_references', tags=self.tags)
+        self.assertIn('добавлено 0, обновлено 1, без изменений 1', output)
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(Tag.objects.get(slug='lunch').color, '#000000')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class GenerateDataTest(TestCase):
+    """
+    Проверка детерминированности генерации данных: запуски с одним
+    значением --seed создают одинаковые данные.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        run('load_references')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def snapshot():
+        """
+        Функция получения созданных данных без id и абсолютных дат:
+        даты создания берутся относительно первого рецепта.
+        """
+        first = Recipe.objects.order_by('pk').first().created_at
+        return {
+            'users': set(User.objects.values_list(
+                'username', 'email', 'first_name', 'last_name'
+            )),
+            'recipes': {
+                (name, author, text, cooking_time, created_at - first)
+                for name, author, text, cooking_time, created_at
+                in Recipe.objects.values_list(
+                    'name', 'author__username', 'text', 'cooking_time',
+                    'created_at'
+                )
+            },
+            'ingredients': set(IngredientRecipe.objects.values_list(
+                'recipe__name', 'ingredient', 'amount'
+            )),
+            'tags': set(Recipe.tags.through.objects.values_list(
+                'recipe__name', 'tag'
+            )),
+            'favorites': set(Favorite.objects.values_list(
+                'user__username', 'recipe__name'
+            )),
+            'cart': set(ShoppingCart.objects.values_list(
+                'user__username', 'recipe__name'
+            )),
+            'subscriptions': set(Subscribe.objects.values_list(
+                'user__username', 'author__username'
+            )),
+            'shopping_lists': set(ShoppingListItem.objects.values_list(
+                'user__username', 'ingredient', 'amount'
+            )),
+        }
+
+    def test_same_seed_same_data(self):
+        run('generate_data', **GENERATE_OPTIONS)
+        first = self.snapshot()
+        self.assertEqual(len(first['users']), GENERATE_OPTIONS['users'])
+        self.assertEqual(len(first['recipes']), GENERATE_OPTIONS['recipes'])
+        self.assertTrue(all(first.values()))
+        User.objects.all().delete()
+        run('generate_data', **GENERATE_OPTIONS)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_same_seed_twice_rejected(self):
+        run('generate_data', **GENERATE_OPTIONS)
+        with self.assertRaises(CommandError):
+            run('generate_data', **GENERATE_OPTIONS)
+        self.assertEqual(User.objects.count(), GENERATE_OPTIONS['users'])
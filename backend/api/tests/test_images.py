@@ -0,0 +1,222 @@
+import shutil
+import struct
+import tempfile
+import zlib
+from base64 import b64encode
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from .fixtures import seed_dataset
+from api.serializers import RecipeImageField
+from recipes.images import DERIVATIVE_FORMATS, make_derivatives
+from recipes.models import Recipe
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_bytes(size, image_format='PNG', mode='RGB'):
+    content = BytesIO()
+    Image.new(mode, size, 'red').save(content, image_format)
+    return content.getvalue()
+
+
+def data_uri(content, image_format='png'):
+    return f'data:image/{image_format};base64,{b64encode(content).decode()}'
+
+
+def png_header(width, height):
+    """
+    Функция получения PNG, заголовок которого заявляет заданные
+    размеры, а данных изображения нет.
+    """
+    content = image_bytes((1, 1))
+    ihdr = struct.pack('>II', width, height) + content[24:29]
+    return (
+        content[:16]
+        + ihdr
+        + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+        + content[33:]
+    )
+
+
+class RecipeImageFieldTest(TestCase):
+    """
+    Проверка поля изображения рецепта: число пикселей проверяется
+    по заголовку, base64 с переносами строк принимается,
+    некорректный base64 отклоняется, большие изображения уменьшаются.
+    """
+
+    def setUp(self):
+        self.field = RecipeImageField()
+
+    def load(self, data):
+        upload = self.field.to_internal_value(data)
+        self.addCleanup(upload.close)
+        upload.seek(0)
+        with Image.open(upload) as image:
+            image.load()
+            return image.format, image.size
+
+    def test_header_pixels_limit(self):
+        with self.assertRaises(ValidationError):
+            self.field.to_internal_value(
+                data_uri(png_header(100_000, 100_000))
+            )
+        for image_format, setting in (
+            ('PNG', 'MAX_DECODED_IMAGE_PIXELS'),
+            ('JPEG', 'MAX_IMAGE_PIXELS'),
+        ):
+            with self.subTest(image_format=image_format):
+                data = data_uri(image_bytes((50, 50), image_format))
+                with override_settings(**{setting: 2499}):
+                    with self.assertRaises(ValidationError):
+                        self.field.to_internal_value(data)
+                with override_settings(**{setting: 2500}):
+                    self.assertEqual(self.load(data)[1], (50, 50))
+
+    @mock.patch('api.serializers.BASE64_CHUNK_SIZE', 64)
+    def test_wrapped_base64(self):
+        content = image_bytes((40, 30))
+        encoded = b64encode(content).decode()
+        wrapped = '\r\n '.join(
+            encoded[start:start + 76]
+            for start in range(0, len(encoded), 76)
+        )
+        self.assertEqual(
+            self.load(f'data:image/png;base64,\n{wrapped}\n'),
+            ('PNG', (40, 30))
+        )
+
+    def test_invalid_base64(self):
+        for data in (
+            'data:image/png;base64,не base64',
+            'data:image/png;base64,iVBORw0KGgo',
+            data_uri(b'not an image'),
+        ):
+            with self.subTest(data=data):
+                with self.assertRaises(ValidationError):
+                    self.field.to_internal_value(data)
+
+    def test_invalid_base64_response(self):
+        client = APIClient()
+        client.force_authenticate(seed_dataset(
+            users=1,
+            recipes=1,
+            ingredients=5,
+            tags=2,
+            relations_per_user=0
+        )[0])
+        response = client.post(
+            '/api/recipes/',
+            {'image': 'data:image/png;base64,@@@'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    @override_settings(MAX_IMAGE_SIDE=2048)
+    def test_downscale(self):
+        for image_format, size, expected in (
+            ('PNG', (3000, 1500), (2048, 1024)),
+            ('JPEG', (1500, 4096), (750, 2048)),
+            ('PNG', (2048, 100), (2048, 100)),
+        ):
+            with self.subTest(image_format=image_format, size=size):
+                self.assertEqual(
+                    self.load(data_uri(image_bytes(size, image_format))),
+                    (image_format, expected)
+                )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DerivativesTest(TestCase):
+    """
+    Проверка создания уменьшенных копий изображения рецепта:
+    копии всех форматов и ширин, прозрачность в WebP,
+    фон вместо прозрачности в JPEG.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(
+            users=1,
+            recipes=1,
+            ingredients=5,
+            tags=2,
+            relations_per_user=0
+        )
+        cls.recipe = Recipe.objects.get()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def save_image(self, image):
+        content = BytesIO()
+        image.save(content, 'PNG')
+        self.recipe.image.save('photo.png', ContentFile(content.getvalue()))
+        return self.recipe.image.name
+
+    def derivatives(self, image):
+        name = self.save_image(image)
+        make_derivatives(self.recipe.pk, name)
+        self.recipe.refresh_from_db()
+        derivatives = self.recipe.image_derivatives
+        self.assertEqual(derivatives.keys(), DERIVATIVE_FORMATS.keys())
+        storage = self.recipe.image.storage
+        images = {}
+        for image_format, (pil_format, _, _) in DERIVATIVE_FORMATS.items():
+            self.assertEqual(
+                derivatives[image_format].keys(),
+                {str(width) for width in settings.IMAGE_DERIVATIVE_WIDTHS}
+            )
+            for width, derivative_name in derivatives[image_format].items():
+                with storage.open(derivative_name) as file:
+                    derivative = Image.open(file)
+                    derivative.load()
+                self.assertEqual(derivative.format, pil_format)
+                self.assertEqual(derivative.width, int(width))
+                images[image_format, int(width)] = derivative
+        return images
+
+    def test_opaque_image(self):
+        width = max(settings.IMAGE_DERIVATIVE_WIDTHS)
+        images = self.derivatives(Image.new('RGB', (width * 2, width), 'red'))
+        for (_, size), image in images.items():
+            self.assertEqual(image.mode, 'RGB')
+            self.assertEqual(image.height, size // 2)
+
+    def test_transparent_image(self):
+        width = max(settings.IMAGE_DERIVATIVE_WIDTHS)
+        image = Image.new('RGBA', (width, width), (255, 0, 0, 0))
+        image.paste((255, 0, 0, 255), (0, 0, width // 2, width))
+        images = self.derivatives(image)
+        for (image_format, size), image in images.items():
+            opaque = image.convert('RGBA').getpixel((0, 0))
+            transparent = image.convert('RGBA').getpixel((size - 1, 0))
+            if image_format == 'webp':
+                self.assertEqual(image.mode, 'RGBA')
+                self.assertEqual(opaque[3], 255)
+                self.assertEqual(transparent[3], 0)
+            else:
+                self.assertEqual(image.mode, 'RGB')
+                self.assertGreater(opaque[0], 200)
+                self.assertLess(opaque[1], 60)
+                self.assertGreater(min(transparent), 230)
+
+    def test_replaced_image(self):
+        name = self.save_image(Image.new('RGB', (400, 300), 'red'))
+        self.save_image(Image.new('RGB', (400, 300), 'blue'))
+        Recipe.objects.filter(pk=self.recipe.pk).update(image_derivatives={})
+        make_derivatives(self.recipe.pk, name)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_derivatives, {})
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .fixtures import seed_dataset
+from api.memberships import memberships
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscribe
+
+
+class MembershipCacheTest(TestCase):
+    """
+    Проверка флагов избранного, списка покупок и подписки из кэша
+    множеств пользователя: кэш общий для процессов, сбрасывается
+    после фиксации транзакции и не используется для больших множеств.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_dataset(
+            users=5,
+            recipes=20,
+            ingredients=10,
+            tags=2,
+            relations_per_user=3
+        )
+        cls.user = cls.users[0]
+        cls.recipe = Recipe.objects.exclude(author=cls.user).first()
+        Favorite.objects.filter(user=cls.user, recipe=cls.recipe).delete()
+        ShoppingCart.objects.filter(user=cls.user, recipe=cls.recipe).delete()
+        Subscribe.objects.filter(
+            user=cls.user,
+            author=cls.recipe.author
+        ).delete()
+
+    def setUp(self):
+        caches[settings.MEMBERSHIP_CACHE].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def flags(self):
+        data = self.client.get(f'/api/recipes/{self.recipe.pk}/').data
+        return (
+            data['is_favorited'],
+            data['is_in_shopping_cart'],
+            data['author']['is_subscribed']
+        )
+
+    def test_flags_follow_changes(self):
+        self.assertEqual(self.flags(), (False, False, False))
+        urls = (
+            f'/api/recipes/{self.recipe.pk}/favorite/',
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            f'/api/users/{self.recipe.author.pk}/subscribe/',
+        )
+        expected = [False, False, False]
+        for number, url in enumerate(urls):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.post(url).status_code, 201)
+            expected[number] = True
+            self.assertEqual(self.flags(), tuple(expected))
+        for number, url in enumerate(urls):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.delete(url).status_code, 204)
+            expected[number] = False
+            self.assertEqual(self.flags(), tuple(expected))
+
+    def test_invalidation_waits_for_commit(self):
+        self.flags()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(self.flags()[0], False)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.flags()[0], True)
+
+    def test_warm_cache_is_shared(self):
+        sets = memberships.get(self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(memberships.get(self.user.pk), sets)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(
+            sets[Favorite],
+            set(Favorite.objects.filter(
+                user=self.user
+            ).values_list('recipe_id', flat=True))
+        )
+
+    def test_large_sets_fall_back_to_exists(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        max_ids = memberships.max_ids
+        memberships.max_ids = 0
+        try:
+            self.assertIsNone(memberships.get(self.user.pk)[Favorite])
+            self.assertEqual(self.flags()[0], True)
+        finally:
+            memberships.max_ids = max_ids
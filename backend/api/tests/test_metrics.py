@@ -0,0 +1,99 @@
+import re
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .fixtures import seed_dataset
+from api.metrics import request_metrics
+
+
+SERVER_TIMING = re.compile(
+    r'^db;dur=[\d.]+;desc="(\d+) queries", serializer;dur=[\d.]+, '
+    r'render;dur=[\d.]+, total;dur=[\d.]+$'
+)
+
+
+class RequestMetricsTest(TestCase):
+    """
+    Проверка учета запросов: заголовок Server-Timing, гистограммы
+    маршрутов (в том числе SQL-запросы при передаче потокового ответа)
+    и выгрузка метрик администратору.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_dataset(
+            users=3,
+            recipes=10,
+            ingredients=10,
+            tags=2,
+            relations_per_user=2
+        )
+        cls.user = cls.users[0]
+        cls.admin = cls.users[1]
+        cls.admin.is_staff = True
+        cls.admin.save()
+
+    def setUp(self):
+        request_metrics.clear()
+        self.addCleanup(request_metrics.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def route(response):
+        return response.wsgi_request.resolver_match.view_name
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        match = SERVER_TIMING.match(response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        self.assertEqual(int(match[1]), len(context.captured_queries))
+        route = self.route(response)
+        _, serializer = request_metrics.phase_duration.series[
+            (route, 'serializer')
+        ]
+        self.assertGreater(serializer, 0)
+        counts, queries = request_metrics.queries.series[(route,)]
+        self.assertEqual(sum(counts), 1)
+        self.assertEqual(queries, len(context.captured_queries))
+
+    def test_streaming_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/?file_format=txt'
+            )
+            self.assertTrue(response.streaming)
+            route = self.route(response)
+            self.assertNotIn((route,), request_metrics.queries.series)
+            b''.join(response.streaming_content)
+        _, queries = request_metrics.queries.series[(route,)]
+        self.assertEqual(queries, len(context.captured_queries))
+        self.assertGreater(
+            queries,
+            int(SERVER_TIMING.match(response['Server-Timing'])[1])
+        )
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/recipes/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(APIClient().get('/api/metrics/').status_code, 401)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        content = response.content.decode()
+        for line in (
+            '# TYPE foodgram_request_duration_seconds histogram',
+            'foodgram_request_duration_seconds_count{route="recipes-list",'
+            'method="GET",status="200"} 1',
+            'foodgram_request_queries_bucket{route="recipes-list",'
+            'le="+Inf"} 1',
+            'foodgram_request_phase_duration_seconds_count{'
+            'route="recipes-list",phase="serializer"} 1',
+        ):
+            self.assertIn(line, content)
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .fixtures import seed_dataset
+from recipes.images import DERIVATIVES_DIR
+from recipes.models import Recipe
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+OLD = 0
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DeleteOrphanImagesTest(TestCase):
+    """
+    Проверка команды delete_orphan_images: удаляются только старые
+    файлы без ссылок рецептов, в режиме --dry-run файлы только
+    выводятся; результат не зависит от числа проходов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(
+            users=2,
+            recipes=3,
+            ingredients=5,
+            tags=2,
+            relations_per_user=1
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        self.storage = Recipe._meta.get_field('image').storage
+        recipes = list(Recipe.objects.order_by('pk'))
+        self.referenced = set()
+        for number, recipe in enumerate(recipes):
+            recipe.image = self.save(f'recipe/images/{number}.png')
+            recipe.image_derivatives = {'webp': {'160': self.save(
+                f'{DERIVATIVES_DIR}/{number}_160.webp'
+            )}}
+            self.referenced.update((
+                recipe.image.name,
+                recipe.image_derivatives['webp']['160']
+            ))
+        Recipe.objects.bulk_update(recipes, ('image', 'image_derivatives'))
+        self.orphans = {
+            self.save('recipe/images/orphan.png'),
+            self.save(f'{DERIVATIVES_DIR}/orphan_160.webp'),
+        }
+        self.recent = self.save('recipe/images/recent.png', old=False)
+
+    def save(self, name, old=True):
+        name = self.storage.save(name, ContentFile(name.encode()))
+        if old:
+            os.utime(self.storage.path(name), (OLD, OLD))
+        return name
+
+    def files(self):
+        return {
+            os.path.relpath(os.path.join(directory, file), MEDIA_ROOT)
+            for directory, _, files in os.walk(MEDIA_ROOT)
+            for file in files
+        }
+
+    def run_command(self, *args):
+        output = StringIO()
+        call_command('delete_orphan_images', *args, stdout=output)
+        return output.getvalue()
+
+    def test_dry_run(self):
+        output = self.run_command('--dry-run')
+        self.assertEqual(set(output.splitlines()[:-1]), self.orphans)
+        self.assertIn('Найдено неиспользуемых файлов: 2.', output)
+        self.assertEqual(
+            self.files(),
+            self.referenced | self.orphans | {self.recent}
+        )
+
+    def test_delete(self):
+        for max_names in (1000, 1):
+            with self.subTest(max_names=max_names):
+                self.setUp()
+                output = self.run_command(f'--max-names={max_names}')
+                self.assertIn('Удалено неиспользуемых файлов: 2.', output)
+                self.assertEqual(self.files(), self.referenced | {self.recent})
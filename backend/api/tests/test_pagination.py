@@ -0,0 +1,268 @@
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from unittest import skipUnless
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .fixtures import User, seed_dataset
+from api.tag_index import tag_index
+from recipes.models import Recipe, Subscribe
+from recipes.search import search_recipes, update_search_vectors
+
+
+CURSOR_PAGE_SIZE = 7
+PAGE_SIZE = 7
+COUNT_CAP = 10
+
+
+class CursorPaginationTest(TestCase):
+    """
+    Проверка обхода всех страниц в режиме курсора для каждой сортировки:
+    каждая запись выводится ровно один раз, без пропусков, в том числе
+    при равных датах создания и названиях и при изменении записей
+    между страницами; обход завершается.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_dataset(
+            users=20,
+            recipes=60,
+            ingredients=30,
+            tags=4
+        )
+        recipes = list(Recipe.objects.order_by('pk'))
+        created_at = timezone.now() - timedelta(days=1)
+        for number, recipe in enumerate(recipes):
+            recipe.text = ' '.join(['рецепт'] * (number % 5 + 1))
+            # Равные даты создания и названия у соседних рецептов:
+            # порядок между ними задает только id.
+            recipe.created_at = created_at + timedelta(minutes=number // 4)
+            recipe.name = f'Рецепт {number % 2}'
+        Recipe.objects.bulk_update(recipes, ('text', 'created_at', 'name'))
+        update_search_vectors(Recipe.objects.all())
+        cls.user = cls.users[0]
+        Subscribe.objects.bulk_create(
+            (
+                Subscribe(user=cls.user, author=author)
+                for author in cls.users[1:]
+            ),
+            ignore_conflicts=True
+        )
+
+    def setUp(self):
+        # Теги созданы bulk_create без сигналов: индекс тегов
+        # мог остаться от предыдущих тестов.
+        cache.clear()
+        tag_index.invalidate()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, link):
+        response = self.client.get(link)
+        self.assertEqual(response.status_code, 200, link)
+        return response.data
+
+    def first_link(self, url):
+        separator = '&' if '?' in url else '?'
+        return f'{url}{separator}cursor=&limit={CURSOR_PAGE_SIZE}'
+
+    def walk(self, url, link=None):
+        """Функция обхода всех страниц курсора с id записей страниц."""
+        link = link or self.first_link(url)
+        pages = []
+        while link:
+            self.assertLess(len(pages), 100, f'Обход не завершился: {url}')
+            data = self.get(link)
+            pages.append([item['id'] for item in data['results']])
+            link = data['next']
+        return pages
+
+    def assertWalk(self, url, expected):
+        ids = [id for page in self.walk(url) for id in page]
+        self.assertEqual(
+            len(ids),
+            len(set(ids)),
+            f'Повторы записей: {url}'
+        )
+        self.assertEqual(ids, list(expected), url)
+
+    def recipe_ids(self, recipes):
+        return recipes.order_by(
+            '-created_at',
+            'name',
+            'id'
+        ).values_list('id', flat=True)
+
+    def test_recipes(self):
+        author = self.users[1]
+        for url, recipes in (
+            ('/api/recipes/', Recipe.objects.all()),
+            (
+                '/api/recipes/?tags=tag0',
+                Recipe.objects.filter(tags__slug='tag0')
+            ),
+            (
+                f'/api/recipes/?author={author.pk}',
+                Recipe.objects.filter(author=author)
+            ),
+            (
+                '/api/recipes/?is_favorited=1',
+                Recipe.objects.filter(favorites__user=self.user)
+            ),
+        ):
+            with self.subTest(url=url):
+                self.assertWalk(url, self.recipe_ids(recipes))
+
+    def test_subscriptions(self):
+        self.assertWalk(
+            '/api/users/subscriptions/',
+            User.objects.filter(
+                authors__user=self.user
+            ).order_by('username', 'id').values_list('id', flat=True)
+        )
+
+    def test_search(self):
+        self.assertWalk(
+            f'/api/recipes/?search={quote("рецепт")}',
+            search_recipes(
+                Recipe.objects.all(),
+                'рецепт'
+            ).order_by('-rank', '-created_at', 'name', 'id').values_list(
+                'id',
+                flat=True
+            )
+        )
+
+    def test_changes_between_pages(self):
+        expected = list(self.recipe_ids(Recipe.objects.all()))
+        data = self.get(self.first_link('/api/recipes/'))
+        first_page = [item['id'] for item in data['results']]
+        self.assertEqual(first_page, expected[:CURSOR_PAGE_SIZE])
+        deleted = expected[CURSOR_PAGE_SIZE + 1]
+        Recipe.objects.filter(pk=deleted).delete()
+        newest, oldest = (
+            Recipe.objects.create(
+                author=self.user,
+                name=name,
+                text='рецепт',
+                cooking_time=1,
+                image='recipe/images/seed.png'
+            )
+            for name in ('Новый', 'Старый')
+        )
+        Recipe.objects.filter(pk=oldest.pk).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        ids = [
+            id for page in self.walk('/api/recipes/', data['next'])
+            for id in page
+        ]
+        # Запись перед позицией курсора не выводится, после нее -
+        # выводится в своем месте; удаленная запись пропускается.
+        self.assertNotIn(newest.pk, ids)
+        self.assertEqual(
+            ids,
+            [
+                id for id in expected[CURSOR_PAGE_SIZE:] if id != deleted
+            ] + [oldest.pk]
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in (
+            'не base64',
+            'e30',
+            urlsafe_b64encode(b'{"a": 1}').decode(),
+            urlsafe_b64encode(b'[1, 2]').decode(),
+            urlsafe_b64encode(b'["x", "y", "z"]').decode(),
+            urlsafe_b64encode(b'[null, [], {}]').decode(),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    f'/api/recipes/?cursor={quote(cursor)}'
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+class ApproximateCountTest(TestCase):
+    """
+    Проверка приближенного подсчета рецептов: признак count_exact
+    соответствует способу подсчета, а номер страницы при приближенном
+    числе записей проверяется выборкой.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=10, recipes=60, ingredients=30, tags=4)
+        cls.tagged = Recipe.objects.filter(tags__slug='tag0').count()
+
+    def setUp(self):
+        cache.clear()
+        tag_index.invalidate()
+        self.client = APIClient()
+
+    def get(self, url, status_code=200):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status_code, url)
+        return response.data
+
+    def test_exact_table_count(self):
+        data = self.get(f'/api/recipes/?limit={PAGE_SIZE}')
+        self.assertEqual(data['count'], 60)
+        self.assertIs(data['count_exact'], True)
+
+    def test_cached_table_count_is_approximate(self):
+        self.get(f'/api/recipes/?limit={PAGE_SIZE}')
+        data = self.get(f'/api/recipes/?limit={PAGE_SIZE}')
+        self.assertEqual(data['count'], 60)
+        self.assertIs(data['count_exact'], False)
+
+    @skipUnless(
+        connection.vendor == 'postgresql',
+        'Оценка числа записей доступна только в PostgreSQL'
+    )
+    @override_settings(PAGINATION_COUNT_CAP=COUNT_CAP)
+    def test_estimated_table_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Recipe._meta.db_table}')
+        data = self.get(f'/api/recipes/?limit={PAGE_SIZE}')
+        self.assertEqual(data['count'], 60)
+        self.assertIs(data['count_exact'], False)
+
+    @override_settings(PAGINATION_COUNT_CAP=COUNT_CAP)
+    def test_capped_count(self):
+        data = self.get(f'/api/recipes/?tags=tag0&limit={PAGE_SIZE}')
+        self.assertEqual(data['count'], COUNT_CAP)
+        self.assertIs(data['count_exact'], False)
+
+    @override_settings(PAGINATION_COUNT_CAP=1000)
+    def test_filtered_exact_count(self):
+        data = self.get(f'/api/recipes/?tags=tag0&limit={PAGE_SIZE}')
+        self.assertEqual(data['count'], self.tagged)
+        self.assertIs(data['count_exact'], True)
+
+    @override_settings(PAGINATION_COUNT_CAP=COUNT_CAP)
+    def test_pages_with_inexact_count(self):
+        url = f'/api/recipes/?tags=tag0&limit={PAGE_SIZE}'
+        pages = -(-self.tagged // PAGE_SIZE)
+        self.assertGreater(pages * PAGE_SIZE, COUNT_CAP + PAGE_SIZE)
+        ids = []
+        for number in range(1, pages + 1):
+            data = self.get(f'{url}&page={number}')
+            self.assertIs(data['count_exact'], False)
+            self.assertEqual(data['next'] is None, number == pages)
+            ids.extend(item['id'] for item in data['results'])
+        self.assertEqual(
+            ids,
+            list(Recipe.objects.filter(
+                tags__slug='tag0'
+            ).order_by('-created_at', 'name').values_list('id', flat=True))
+        )
+        for page in (pages + 1, 0, 'abc', 1.5):
+            with self.subTest(page=page):
+                self.get(f'{url}&page={page}', status_code=404)
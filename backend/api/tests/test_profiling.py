@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .fixtures import seed_dataset
+from api.profiling import PROFILE_HEADER, PROFILE_NAME, request_profiler
+
+
+class ProfilingTest(TestCase):
+    """
+    Проверка профилирования по заголовку X-Profile: профиль
+    записывается только для запросов администраторов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.admin = seed_dataset(
+            users=2,
+            recipes=2,
+            ingredients=5,
+            tags=2,
+            relations_per_user=1
+        )
+        cls.admin.is_staff = True
+        cls.admin.save()
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        patcher = mock.patch.object(
+            request_profiler,
+            'directory',
+            Path(directory)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, client):
+        response = client.get('/api/recipes/', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def token_client(self, user):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}'
+        )
+        return client
+
+    def test_ignored_for_non_staff(self):
+        for client in (APIClient(), self.token_client(self.user)):
+            self.assertNotIn(PROFILE_HEADER, self.get(client))
+        session = APIClient()
+        session.force_login(self.user)
+        self.assertNotIn(PROFILE_HEADER, self.get(session))
+        self.assertEqual(request_profiler.files(), [])
+
+    def test_written_for_staff(self):
+        session = APIClient()
+        session.force_login(self.admin)
+        for client in (self.token_client(self.admin), session):
+            name = self.get(client)[PROFILE_HEADER]
+            self.assertRegex(name, PROFILE_NAME)
+            self.assertTrue((request_profiler.directory / name).is_file())
+        self.assertEqual(len(request_profiler.files()), 2)
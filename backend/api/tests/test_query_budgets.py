@@ -0,0 +1,348 @@
+import shutil
+import tempfile
+from base64 import b64encode
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .fixtures import seed_dataset
+from api.ingredient_index import ingredient_index
+from api.slow_queries import slow_query_log
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscribe
+from recipes.search import update_search_vectors
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# Бюджеты измерены в PostgreSQL (рабочая СУБД), различия с SQLite
+# вынесены в константы ниже. Из чего складываются бюджеты:
+# - страница рецептов: подсчет, рецепты, теги и продукты (prefetch),
+#   для пользователя - еще множества избранного, списка покупок
+#   и подписок (один запрос при холодном кэше api.memberships);
+#   фильтр по тегам читает слаги тегов, фильтр по автору - автора;
+# - запись в transaction.atomic внутри TestCase добавляет SAVEPOINT
+#   и RELEASE SAVEPOINT на каждый блок (в работе это BEGIN/COMMIT).
+PAGE_SIZES = (1, 20)
+POSTGRESQL = connection.vendor == 'postgresql'
+# В PostgreSQL подсчет рецептов без фильтров начинается
+# с оценки числа строк по статистике таблицы (ApiPaginator.table_count).
+TABLE_COUNT_QUERIES = 2 if POSTGRESQL else 1
+# В PostgreSQL запись рецепта пересчитывает поисковый вектор
+# одним запросом UPDATE (update_search_vectors).
+SEARCH_VECTOR_QUERIES = 1 if POSTGRESQL else 0
+BULK_SIZES = (1, 10)
+
+
+def image_data():
+    content = BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(content, 'PNG')
+    return 'data:image/png;base64,' + b64encode(content.getvalue()).decode()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryBudgetTest(TestCase):
+    """
+    Проверка числа запросов к БД эндпоинтов API.
+    Каждый запрос выполняется с холодными кэшами процесса и должен
+    уложиться в бюджет, а для списков - не зависеть от размера
+    страницы и числа объектов в массовых операциях.
+    При превышении бюджета выводятся выполненные SQL-запросы.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_dataset(
+            users=30,
+            recipes=120,
+            ingredients=60,
+            tags=6
+        )
+        # Без поисковых векторов поиск в PostgreSQL ничего не находит
+        # и бюджет поиска не проверяет загрузку страницы.
+        update_search_vectors(Recipe.objects.all())
+        cls.user = cls.users[0]
+        cls.user.set_password('password-budget')
+        cls.user.save()
+        cls.recipe = Recipe.objects.exclude(author=cls.user).first()
+        cls.own_recipe = Recipe.objects.filter(author=cls.user).first()
+        cls.author = cls.users[-1]
+        Subscribe.objects.filter(user=cls.user, author=cls.author).delete()
+        Favorite.objects.filter(user=cls.user, recipe=cls.recipe).delete()
+        ShoppingCart.objects.filter(user=cls.user, recipe=cls.recipe).delete()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.anon = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.reset_caches()
+        # EXPLAIN медленных запросов не должен попадать в бюджет.
+        patcher = mock.patch.object(slow_query_log, 'threshold', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def reset_caches():
+        cache.clear()
+        caches[settings.MEMBERSHIP_CACHE].clear()
+        ingredient_index.invalidate()
+
+    def assertBudget(self, client, method, url, budget, data=None,
+                     status_code=status.HTTP_200_OK):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        request = f'{method.upper()} {url}'
+        self.assertEqual(
+            response.status_code,
+            status_code,
+            f'{request}: {getattr(response, "data", None)}'
+        )
+        queries = [query['sql'] for query in context.captured_queries]
+        if len(queries) > budget:
+            self.fail(
+                f'{request}: {len(queries)} запросов при бюджете {budget}:\n'
+                + '\n'.join(
+                    f'{number}. {sql}'
+                    for number, sql in enumerate(queries, 1)
+                )
+            )
+        return len(queries)
+
+    def assertConstant(self, counts, name):
+        self.assertEqual(
+            len(set(counts.values())),
+            1,
+            f'Число запросов зависит от {name}: {counts}'
+        )
+
+    def assertPageBudget(self, client, url, budget):
+        separator = '&' if '?' in url else '?'
+        counts = {}
+        for limit in PAGE_SIZES:
+            self.reset_caches()
+            counts[limit] = self.assertBudget(
+                client,
+                'get',
+                f'{url}{separator}limit={limit}&recipes_limit={limit}',
+                budget
+            )
+        self.assertConstant(counts, f'размера страницы ({url})')
+
+    def test_recipe_lists(self):
+        tags = '&'.join(f'tags=tag{number}' for number in range(3))
+        # У каждого рецепта два тега: со всеми тремя тегами рецептов нет.
+        all_tags = 'tags=tag0&tags=tag1'
+        for client, url, budget in (
+            (self.anon, '/api/recipes/', 3 + TABLE_COUNT_QUERIES),
+            (self.anon, '/api/recipes/?cursor=', 3),
+            (self.anon, f'/api/recipes/?{tags}', 5),
+            (self.anon, f'/api/recipes/?{all_tags}&tags_match=all', 5),
+            (self.anon, f'/api/recipes/?author={self.author.pk}', 5),
+            (self.anon, '/api/recipes/?search=рецепт', 4),
+            (self.client, '/api/recipes/', 4 + TABLE_COUNT_QUERIES),
+            (self.client, '/api/recipes/?cursor=', 4),
+            (self.client, f'/api/recipes/?{tags}', 6),
+            (self.client, '/api/recipes/?is_favorited=1', 5),
+            (self.client, '/api/recipes/?is_in_shopping_cart=1', 5),
+        ):
+            with self.subTest(url=url, user=client is self.client):
+                self.assertPageBudget(client, url, budget)
+
+    def test_recipe_detail(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.assertBudget(self.anon, 'get', url, 3)
+        self.assertBudget(self.client, 'get', url, 4)
+
+    def test_references(self):
+        ingredient = self.recipe.ingredients.first()
+        tag = self.recipe.tags.first()
+        for url, budget in (
+            ('/api/tags/', 1),
+            (f'/api/tags/{tag.pk}/', 1),
+            ('/api/ingredients/', 1),
+            ('/api/ingredients/?name=прод', 1),
+            (f'/api/ingredients/{ingredient.pk}/', 1),
+        ):
+            with self.subTest(url=url):
+                self.reset_caches()
+                self.assertBudget(self.anon, 'get', url, budget)
+
+    def test_users(self):
+        self.assertPageBudget(self.client, '/api/users/', 2)
+        self.assertBudget(
+            self.client,
+            'get',
+            f'/api/users/{self.author.pk}/',
+            1
+        )
+        self.assertBudget(self.client, 'get', '/api/users/me/', 0)
+
+    def test_subscriptions(self):
+        self.assertPageBudget(self.client, '/api/users/subscriptions/', 3)
+        self.assertPageBudget(
+            self.client,
+            '/api/users/subscriptions/?cursor=',
+            2
+        )
+
+    def test_toggles(self):
+        for method, url, budget, status_code in (
+            (
+                'post',
+                f'/api/recipes/{self.recipe.pk}/favorite/',
+                4,
+                status.HTTP_201_CREATED
+            ),
+            (
+                'delete',
+                f'/api/recipes/{self.recipe.pk}/favorite/',
+                3,
+                status.HTTP_204_NO_CONTENT
+            ),
+            (
+                'post',
+                f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+                8,
+                status.HTTP_201_CREATED
+            ),
+            (
+                'delete',
+                f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+                8,
+                status.HTTP_204_NO_CONTENT
+            ),
+            (
+                'post',
+                f'/api/users/{self.author.pk}/subscribe/',
+                4,
+                status.HTTP_201_CREATED
+            ),
+            (
+                'delete',
+                f'/api/users/{self.author.pk}/subscribe/',
+                1,
+                status.HTTP_204_NO_CONTENT
+            ),
+        ):
+            with self.subTest(method=method, url=url):
+                self.reset_caches()
+                self.assertBudget(
+                    self.client,
+                    method,
+                    url,
+                    budget,
+                    status_code=status_code
+                )
+
+    def test_bulk(self):
+        recipes = list(Recipe.objects.values_list('pk', flat=True))
+        authors = [user.pk for user in self.users[1:]]
+        for method, url, ids, budget in (
+            ('post', '/api/recipes/favorite/', recipes, 4),
+            ('delete', '/api/recipes/favorite/', recipes, 5),
+            ('post', '/api/recipes/shopping_cart/', recipes, 8),
+            ('delete', '/api/recipes/shopping_cart/', recipes, 10),
+            ('post', '/api/users/subscribe/', authors, 4),
+            ('delete', '/api/users/subscribe/', authors, 5),
+        ):
+            counts = {}
+            for size in BULK_SIZES:
+                self.reset_caches()
+                counts[size] = self.assertBudget(
+                    self.client,
+                    method,
+                    url,
+                    budget,
+                    data={'ids': ids[:size]}
+                )
+            self.assertConstant(counts, f'числа объектов ({method} {url})')
+
+    def test_download_shopping_cart(self):
+        for file_format, budget in (('txt', 2), ('csv', 1), ('json', 2)):
+            with self.subTest(file_format=file_format):
+                self.assertBudget(
+                    self.client,
+                    'get',
+                    '/api/recipes/download_shopping_cart/'
+                    f'?file_format={file_format}',
+                    budget
+                )
+
+    def test_recipe_write(self):
+        ingredients = [
+            {'id': ingredient.pk, 'amount': 10}
+            for ingredient in self.recipe.ingredients.all()
+        ]
+        tags = list(self.recipe.tags.values_list('pk', flat=True))
+        # Проверка тегов и продуктов (2), SAVEPOINT, рецепт, продукты,
+        # теги (2), RELEASE, ответ: теги, продукты, флаги избранного
+        # и списка покупок.
+        self.assertBudget(
+            self.client,
+            'post',
+            '/api/recipes/',
+            12 + SEARCH_VECTOR_QUERIES,
+            data={
+                'ingredients': ingredients,
+                'tags': tags,
+                'image': image_data(),
+                'name': 'Новый рецепт',
+                'text': 'Описание',
+                'cooking_time': 10
+            },
+            status_code=status.HTTP_201_CREATED
+        )
+        url = f'/api/recipes/{self.own_recipe.pk}/'
+        self.reset_caches()
+        # Рецепт с автором, проверка тегов и продуктов (2), SAVEPOINT,
+        # продукты рецепта (4), списки покупок (6 с SAVEPOINT), теги (3),
+        # рецепт, RELEASE, ответ: теги, продукты, флаги избранного
+        # и списка покупок.
+        self.assertBudget(
+            self.client,
+            'patch',
+            url,
+            22 + SEARCH_VECTOR_QUERIES,
+            data={'ingredients': ingredients, 'tags': tags, 'name': 'Имя'}
+        )
+        self.reset_caches()
+        # Рецепт с автором, SAVEPOINT, суммы продуктов, списки покупок
+        # (5 с SAVEPOINT), каскадное удаление (5), RELEASE.
+        self.assertBudget(
+            self.client,
+            'delete',
+            url,
+            14,
+            status_code=status.HTTP_204_NO_CONTENT
+        )
+
+    def test_token(self):
+        client = APIClient()
+        self.assertBudget(
+            client,
+            'post',
+            '/api/auth/token/login/',
+            6,
+            data={'email': self.user.email, 'password': 'password-budget'}
+        )
+        self.assertBudget(
+            self.client,
+            'post',
+            '/api/auth/token/logout/',
+            1,
+            status_code=status.HTTP_204_NO_CONTENT
+        )
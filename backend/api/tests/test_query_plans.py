@@ -0,0 +1,144 @@
+import json
+import re
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .fixtures import seed_dataset
+
+
+LARGE_TABLES = {
+    'recipes_favorite',
+    'recipes_ingredientrecipe',
+    'recipes_recipe',
+    'recipes_recipe_tags',
+    'recipes_shoppingcart',
+    'recipes_shoppinglistitem',
+    'recipes_subscribe',
+    'recipes_user',
+}
+SORT_NODES = {'Sort', 'Incremental Sort'}
+# LIMIT страницы завершает запрос; LIMIT 1 есть и в подзапросах EXISTS.
+PAGE_LIMIT = re.compile(r' LIMIT \d+( OFFSET \d+)?$')
+
+
+def plan_nodes(plan, limited=False):
+    """
+    Функция обхода узлов плана с признаком наличия
+    узла Limit среди предков (или самого узла).
+    """
+    limited = limited or plan['Node Type'] == 'Limit'
+    yield plan, limited
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child, limited)
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'Планы запросов проверяются только в PostgreSQL.'
+)
+class QueryPlanTest(TestCase):
+    """
+    Проверка планов горячих запросов API на заполненной БД.
+    Запросы эндпоинта не должны читать большие таблицы целиком
+    (Seq Scan), а запросы страниц списка рецептов - сортировать
+    строки (Sort): порядок должен обеспечиваться индексом.
+    При capped_count допускается Seq Scan в ограниченном подсчете
+    (LIMIT без ORDER BY): чтение прекращается после
+    PAGINATION_COUNT_CAP найденных записей.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Пользователей столько же, сколько рецептов: при малой таблице
+        # пользователей планировщик выгоднее читает ее целиком.
+        cls.users = seed_dataset(
+            users=20000,
+            recipes=20000,
+            ingredients=1000,
+            tags=10,
+            relations_per_user=3
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']
+
+    def assertPlans(self, url, forbid_sort=False, capped_count=False):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            plan = self.explain(sql)
+            capped = capped_count and ' ORDER BY ' not in sql
+            for node, limited in plan_nodes(plan):
+                with self.subTest(url=url, sql=sql):
+                    self.assertFalse(
+                        node['Node Type'] == 'Seq Scan'
+                        and node['Relation Name'] in LARGE_TABLES
+                        and not (capped and limited),
+                        f'Seq Scan по {node.get("Relation Name")}:\n'
+                        f'{sql}\n{json.dumps(plan, indent=2)}'
+                    )
+                    self.assertFalse(
+                        forbid_sort
+                        and PAGE_LIMIT.search(sql)
+                        and node['Node Type'] in SORT_NODES,
+                        f'Сортировка страницы:\n'
+                        f'{sql}\n{json.dumps(plan, indent=2)}'
+                    )
+
+    def test_recipe_list(self):
+        self.assertPlans('/api/recipes/', forbid_sort=True)
+
+    def test_recipe_list_cursor(self):
+        self.assertPlans('/api/recipes/?cursor=', forbid_sort=True)
+
+    def test_recipe_list_by_author(self):
+        self.assertPlans(
+            f'/api/recipes/?author={self.users[1].pk}',
+            forbid_sort=True
+        )
+
+    def test_recipe_list_by_tags(self):
+        tags = 'tags=tag0&tags=tag1'
+        for url in (
+            f'/api/recipes/?{tags}',
+            f'/api/recipes/?{tags}&tags_match=all',
+            f'/api/recipes/?{tags}&tags_match=all&cursor=',
+        ):
+            with self.subTest(url=url):
+                self.assertPlans(url, forbid_sort=True, capped_count=True)
+
+    def test_recipe_list_favorited(self):
+        self.assertPlans('/api/recipes/?is_favorited=1')
+
+    def test_recipe_list_in_shopping_cart(self):
+        self.assertPlans('/api/recipes/?is_in_shopping_cart=1')
+
+    def test_subscriptions(self):
+        self.assertPlans('/api/users/subscriptions/?recipes_limit=3')
+
+    def test_subscriptions_cursor(self):
+        self.assertPlans('/api/users/subscriptions/?cursor=')
+
+    def test_download_shopping_cart(self):
+        self.assertPlans('/api/recipes/download_shopping_cart/')
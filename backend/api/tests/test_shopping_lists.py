@@ -0,0 +1,198 @@
+import threading
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from .fixtures import seed_dataset
+from api.utils import change_shopping_lists
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem
+)
+
+
+THREADS = 4
+CHANGES_PER_THREAD = 25
+
+
+def shopping_lists():
+    return set(
+        ShoppingListItem.objects.values_list('user', 'ingredient', 'amount')
+    )
+
+
+class ShoppingListTest(TestCase):
+    """
+    Проверка изменения сумм продуктов в списках покупок: изменения
+    складываются с текущими суммами в БД, суммы не уходят ниже нуля
+    и совпадают с пересчетом командой rebuild_shopping_lists.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_dataset(
+            users=6,
+            recipes=20,
+            ingredients=15,
+            tags=2,
+            relations_per_user=4
+        )
+        cls.user = cls.users[0]
+        cls.ingredient = Ingredient.objects.first()
+
+    def amount(self, user):
+        item = ShoppingListItem.objects.filter(
+            user=user,
+            ingredient=self.ingredient
+        ).first()
+        return item and item.amount
+
+    def test_interleaved_changes(self):
+        ShoppingListItem.objects.filter(user=self.user).delete()
+        stale = ShoppingListItem.objects.create(
+            user=self.user,
+            ingredient=self.ingredient,
+            amount=10
+        )
+        for change in (5, -3, 7, -4):
+            change_shopping_lists(
+                (self.user.pk,),
+                {self.ingredient.pk: change}
+            )
+        # Изменения применяются к сумме в БД, а не к прочитанной ранее.
+        stale.refresh_from_db()
+        self.assertEqual(stale.amount, 15)
+
+    def test_clamp_at_zero(self):
+        ShoppingListItem.objects.filter(ingredient=self.ingredient).delete()
+        other = self.users[1]
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(user=user, ingredient=self.ingredient, amount=5)
+            for user in (self.user, other)
+        )
+        change_shopping_lists(
+            (self.user.pk, other.pk, self.users[2].pk),
+            {self.ingredient.pk: -3}
+        )
+        self.assertEqual(self.amount(self.user), 2)
+        change_shopping_lists((self.user.pk,), {self.ingredient.pk: -10})
+        self.assertIsNone(self.amount(self.user))
+        self.assertEqual(self.amount(other), 2)
+        self.assertIsNone(self.amount(self.users[2]))
+
+    def test_no_amounts_no_queries(self):
+        with self.assertNumQueries(0):
+            change_shopping_lists(
+                ShoppingCart.objects.values_list('user', flat=True),
+                {self.ingredient.pk: 0}
+            )
+
+    def test_matches_rebuild(self):
+        client, other = APIClient(), APIClient()
+        client.force_authenticate(self.user)
+        other.force_authenticate(self.users[1])
+        recipes = list(
+            Recipe.objects.exclude(
+                shoppingcarts__user=self.user
+            ).values_list('pk', flat=True)[:3]
+        )
+        for id in recipes:
+            client.post(f'/api/recipes/{id}/shopping_cart/')
+        client.delete(f'/api/recipes/{recipes[0]}/shopping_cart/')
+        client.post(
+            '/api/recipes/shopping_cart/',
+            {'ids': recipes},
+            format='json'
+        )
+        own, deleted = Recipe.objects.filter(author=self.user)[:2]
+        for recipe in (own, deleted):
+            other.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        ingredients = list(Ingredient.objects.order_by('pk')[:3])
+        response = client.patch(
+            f'/api/recipes/{own.pk}/',
+            {'ingredients': [
+                {'id': ingredient.pk, 'amount': number + 1}
+                for number, ingredient in enumerate(ingredients)
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        response = client.delete(f'/api/recipes/{deleted.pk}/')
+        self.assertEqual(response.status_code, 204)
+        maintained = shopping_lists()
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertEqual(maintained, shopping_lists())
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'SQLite не выполняет транзакции параллельно'
+)
+class ConcurrentShoppingListTest(TransactionTestCase):
+    """
+    Проверка параллельных изменений одной суммы продукта
+    в отдельных транзакциях: ни одно изменение не теряется.
+    """
+
+    def setUp(self):
+        self.user = seed_dataset(
+            users=2,
+            recipes=2,
+            ingredients=5,
+            tags=2,
+            ingredients_per_recipe=2,
+            relations_per_user=1
+        )[0]
+        self.ingredient = Ingredient.objects.first()
+        ShoppingListItem.objects.filter(user=self.user).delete()
+
+    def change(self, barrier, amount):
+        try:
+            barrier.wait()
+            for _ in range(CHANGES_PER_THREAD):
+                with transaction.atomic():
+                    change_shopping_lists(
+                        (self.user.pk,),
+                        {self.ingredient.pk: amount}
+                    )
+        finally:
+            connection.close()
+
+    def run_threads(self, amounts):
+        barrier = threading.Barrier(len(amounts))
+        threads = [
+            threading.Thread(target=self.change, args=(barrier, amount))
+            for amount in amounts
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def amount(self):
+        return ShoppingListItem.objects.get(
+            user=self.user,
+            ingredient=self.ingredient
+        ).amount
+
+    def test_increments(self):
+        self.run_threads([1] * THREADS)
+        self.assertEqual(self.amount(), THREADS * CHANGES_PER_THREAD)
+
+    def test_increments_and_decrements(self):
+        ShoppingListItem.objects.create(
+            user=self.user,
+            ingredient=self.ingredient,
+            amount=1000
+        )
+        self.run_threads([3, -1] * (THREADS // 2))
+        self.assertEqual(
+            self.amount(),
+            1000 + THREADS // 2 * CHANGES_PER_THREAD * 2
+        )
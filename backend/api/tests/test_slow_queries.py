@@ -0,0 +1,81 @@
+import json
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .fixtures import seed_dataset
+from api.slow_queries import REDACTED, slow_query_log
+from recipes.models import Recipe
+
+
+PASSWORD = 'password-slow-query'
+
+
+class SlowQueryLogTest(TestCase):
+    """
+    Проверка журнала медленных запросов: параметры скрываются, пока
+    их запись не включена, а ошибка EXPLAIN не прерывает транзакцию.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_dataset(
+            users=2,
+            recipes=2,
+            ingredients=5,
+            tags=2,
+            relations_per_user=1
+        )[0]
+        cls.user.set_password(PASSWORD)
+        cls.user.save()
+
+    def setUp(self):
+        slow_query_log.clear()
+        self.addCleanup(slow_query_log.clear)
+        for name, value in (
+            ('threshold', 0),
+            ('sink', None),
+            ('log_params', False),
+        ):
+            patcher = mock.patch.object(slow_query_log, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def login_records(self):
+        response = APIClient().post(
+            '/api/auth/token/login/',
+            {'email': self.user.email, 'password': PASSWORD},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        records = [
+            record for record in slow_query_log.get_records()
+            if 'email' in record['sql']
+        ]
+        self.assertTrue(records)
+        return records
+
+    def test_params_redacted_by_default(self):
+        for record in self.login_records():
+            self.assertEqual(record['params'], REDACTED)
+            self.assertNotIn(
+                self.user.email,
+                json.dumps(record, ensure_ascii=False, default=str)
+            )
+
+    def test_params_logged_when_enabled(self):
+        slow_query_log.log_params = True
+        for record in self.login_records():
+            self.assertIn(self.user.email, record['params'])
+
+    def test_failing_explain_keeps_transaction(self):
+        with transaction.atomic():
+            plan = slow_query_log.explain(
+                connection,
+                'SELECT * FROM missing_table WHERE id = %s',
+                (1,)
+            )
+            self.assertTrue(plan.startswith('EXPLAIN: '))
+            self.assertEqual(Recipe.objects.count(), 2)
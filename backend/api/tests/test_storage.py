@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from recipes.storage import ContentAddressedStorage
+
+
+THREADS = 8
+CONTENT_NAME = r'^recipe/images/([0-9a-f]{2})/\1[0-9a-f]{62}\.png$'
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    """
+    Проверка хранилища с именами по содержимому: одинаковое содержимое
+    хранится одним файлом, в том числе при параллельном сохранении.
+    """
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, file), self.location)
+            for directory, _, files in os.walk(self.location)
+            for file in files
+        )
+
+    def test_names_by_content(self):
+        name = self.storage.save('recipe/images/photo.PNG', ContentFile(b'1'))
+        self.assertRegex(name, CONTENT_NAME)
+        self.assertEqual(
+            self.storage.save('recipe/images/other.png', ContentFile(b'1')),
+            name
+        )
+        other = self.storage.save('recipe/images/photo.png', ContentFile(b'2'))
+        self.assertNotEqual(other, name)
+        self.assertEqual(self.files(), sorted((name, other)))
+        with self.storage.open(name) as file:
+            self.assertEqual(file.read(), b'1')
+
+    def test_duplicate_save_touches_file(self):
+        name = self.storage.save('recipe/images/photo.png', ContentFile(b'1'))
+        os.utime(self.storage.path(name), (0, 0))
+        self.storage.save('recipe/images/photo.png', ContentFile(b'1'))
+        self.assertGreater(os.path.getmtime(self.storage.path(name)), 0)
+
+    def test_file_created_after_check(self):
+        name = self.storage.save('recipe/images/photo.png', ContentFile(b'1'))
+        # Другой процесс сохранил то же содержимое после проверки exists.
+        with mock.patch.object(self.storage, 'exists', return_value=False):
+            self.assertEqual(
+                self.storage.save(
+                    'recipe/images/photo.png',
+                    ContentFile(b'1')
+                ),
+                name
+            )
+        self.assertEqual(self.files(), [name])
+
+    def test_concurrent_saves(self):
+        barrier = threading.Barrier(THREADS)
+        names = []
+
+        def save():
+            barrier.wait()
+            names.append(self.storage.save(
+                'recipe/images/photo.png',
+                ContentFile(b'1' * 100_000)
+            ))
+
+        threads = [threading.Thread(target=save) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(names)), 1)
+        self.assertEqual(self.files(), names[:1])
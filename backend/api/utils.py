@@ -1,47 +1,369 @@
+import csv
+import json
 from datetime import date
+from io import StringIO
+from itertools import chain
 
-from django.db.models import Sum
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    F,
+    IntegerField,
+    Sum,
+    Value,
+    When,
+    Window
+)
+from django.db.models.functions import Greatest, RowNumber
+from rest_framework.exceptions import ValidationError
 
-from recipes.models import IngredientRecipe, Recipe
+from recipes.models import IngredientRecipe, Recipe, ShoppingListItem
+
+
+BULK_CREATED = 'created'
+BULK_EXISTS = 'exists'
+BULK_DELETED = 'deleted'
+BULK_ABSENT = 'absent'
+BULK_NOT_FOUND = 'not_found'
+
+RECIPES_LIMIT_ERROR = (
+    'Параметр recipes_limit должен быть целым неотрицательным числом!'
+)
+
+
+def get_recipes_limit(request):
+    """
+    Функция получения ограничения количества рецептов автора в ответе
+    из параметра запроса "recipes_limit".
+    Значение ограничено сверху настройкой MAX_RECIPES_LIMIT.
+    """
+    limit = request.query_params.get(
+        'recipes_limit',
+        settings.MAX_RECIPES_LIMIT
+    )
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValidationError({'recipes_limit': RECIPES_LIMIT_ERROR})
+    if limit < 0:
+        raise ValidationError({'recipes_limit': RECIPES_LIMIT_ERROR})
+    return min(limit, settings.MAX_RECIPES_LIMIT)
+
+
+def subscribed_authors(authors):
+    """
+    Функция добавления к запросу авторов, на которых подписан
+    текущий пользователь, количества их рецептов и флага подписки.
+    """
+    return authors.annotate(
+        recipes_count=Count('recipes'),
+        is_subscribed=Value(True, output_field=BooleanField())
+    )
+
+
+def add_recent_recipes(authors, limit):
+    """
+    Функция добавления авторам поля "recent_recipes" с последними
+    рецептами каждого автора (не более limit штук).
+    Рецепты всех авторов выбираются одним запросом с нумерацией строк
+    в пределах автора (ROW_NUMBER() OVER (PARTITION BY author)).
+    """
+    authors = list(authors)
+    recipes_by_author = {author.pk: [] for author in authors}
+    if recipes_by_author and limit:
+        ranked_recipes = Recipe.objects.filter(
+            author__in=recipes_by_author
+        ).annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('created_at').desc(), F('name').asc())
+            )
+        ).order_by()
+        sql, params = ranked_recipes.query.sql_with_params()
+        for recipe in Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked_recipes '
+            'WHERE ranked_recipes.recipe_rank <= %s '
+            'ORDER BY ranked_recipes.author_id, ranked_recipes.recipe_rank',
+            (*params, limit)
+        ):
+            recipes_by_author[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recent_recipes = recipes_by_author[author.pk]
+    return authors
+
+
+def recipes_amounts(recipes, sign=1):
+    """
+    Функция получения суммарных мер продуктов рецептов
+    (id продукта -> мера); при sign=-1 меры берутся со знаком минус.
+    """
+    return {
+        ingredient: sign * amount
+        for ingredient, amount in IngredientRecipe.objects.filter(
+            recipe__in=recipes
+        ).values('ingredient').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient', 'total')
+    }
+
+
+def change_shopping_lists(user_ids, amounts):
+    """
+    Функция изменения сумм продуктов в списках покупок пользователей.
+    amounts - изменения мер продуктов (id продукта -> изменение меры).
+    Увеличения добавляются одним запросом INSERT ... ON CONFLICT
+    (user_id, ingredient_id) DO UPDATE, уменьшения применяются одним
+    запросом UPDATE (не ниже нуля), обнулившиеся суммы удаляются.
+    Каждая строка меняется атомарно, поэтому параллельные изменения
+    не нарушают уникальность продукта в списке пользователя.
+    """
+    amounts = {
+        ingredient: amount for ingredient, amount in amounts.items() if amount
+    }
+    if not amounts:
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    added = [
+        (user, ingredient, amount)
+        for user in user_ids
+        for ingredient, amount in amounts.items()
+        if amount > 0
+    ]
+    removed = {
+        ingredient: amount
+        for ingredient, amount in amounts.items()
+        if amount < 0
+    }
+    with transaction.atomic():
+        if added:
+            add_shopping_list_amounts(added)
+        if removed:
+            items = ShoppingListItem.objects.filter(
+                user__in=user_ids,
+                ingredient__in=removed
+            )
+            items.update(amount=Greatest(
+                F('amount') + Case(
+                    *(
+                        When(ingredient=ingredient, then=Value(amount))
+                        for ingredient, amount in removed.items()
+                    ),
+                    output_field=IntegerField()
+                ),
+                0
+            ))
+            items.filter(amount=0).delete()
+
+
+def add_shopping_list_amounts(rows):
+    """
+    Функция увеличения сумм продуктов в списках покупок запросом
+    INSERT ... ON CONFLICT (user_id, ingredient_id) DO UPDATE.
+    rows - строки (id пользователя, id продукта, мера).
+    """
+    opts = ShoppingListItem._meta
+    quote_name = connection.ops.quote_name
+    table = quote_name(opts.db_table)
+    user, ingredient, amount = (
+        quote_name(opts.get_field(name).column)
+        for name in ('user', 'ingredient', 'amount')
+    )
+    batch_size = connection.ops.bulk_batch_size(
+        (user, ingredient, amount),
+        rows
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+                f'SET {amount} = {table}.{amount} + EXCLUDED.{amount}',
+                list(chain.from_iterable(batch))
+            )
+
+
+def bulk_results(ids, found, changed, changed_status, unchanged_status):
+    """
+    Функция формирования результата массовой операции для каждого id:
+    not_found - объект не найден, changed_status - запись изменена,
+    unchanged_status - изменение не требовалось.
+    """
+    return {'results': [
+        {
+            'id': id,
+            'status': (
+                BULK_NOT_FOUND if id not in found
+                else changed_status if id in changed
+                else unchanged_status
+            )
+        }
+        for id in dict.fromkeys(ids)
+    ]}
+
+
+def insert_ignore_sql(opts, fields, count, suffix=''):
+    """
+    Функция построения запроса INSERT ... ON CONFLICT DO NOTHING
+    для count записей.
+    """
+    quote_name = connection.ops.quote_name
+    values = f'({", ".join(["%s"] * len(fields))})'
+    return (
+        f'INSERT INTO {quote_name(opts.db_table)} '
+        f'({", ".join(quote_name(field.column) for field in fields)}) '
+        f'VALUES {", ".join([values] * count)} '
+        f'ON CONFLICT DO NOTHING{suffix}'
+    )
+
+
+def insert_values(instances, fields):
+    """Функция получения значений полей новых записей для запроса."""
+    return [
+        field.get_db_prep_save(field.pre_save(instance, True), connection)
+        for instance in instances
+        for field in fields
+    ]
+
+
+def insert_ignore(instance):
+    """
+    Функция сохранения новой записи одним запросом
+    INSERT ... ON CONFLICT DO NOTHING.
+    Возвращает True, если запись добавлена, и False,
+    если такая запись уже есть.
+    """
+    opts = instance._meta
+    fields = [
+        field for field in opts.concrete_fields if not field.primary_key
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            insert_ignore_sql(opts, fields, 1),
+            insert_values((instance,), fields)
+        )
+        return cursor.rowcount == 1
+
+
+def bulk_insert_ignore(model, instances, returning):
+    """
+    Функция сохранения новых записей запросом
+    INSERT ... ON CONFLICT DO NOTHING RETURNING.
+    Возвращает множество значений поля returning добавленных записей,
+    записи, которые уже есть, не возвращаются.
+    """
+    if not instances:
+        return set()
+    opts = model._meta
+    fields = [
+        field for field in opts.concrete_fields if not field.primary_key
+    ]
+    suffix = (
+        ' RETURNING '
+        f'{connection.ops.quote_name(opts.get_field(returning).column)}'
+    )
+    batch_size = connection.ops.bulk_batch_size(fields, instances)
+    inserted = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(instances), batch_size):
+            batch = instances[start:start + batch_size]
+            cursor.execute(
+                insert_ignore_sql(opts, fields, len(batch), suffix),
+                insert_values(batch, fields)
+            )
+            inserted.update(row[0] for row in cursor.fetchall())
+    return inserted
 
 
 def shopping_cart_ingredients(user):
     """
-    Функция скачивания списка покупки продуктов
-    для выбранных рецептов пользователя.
+    Функция получения суммарного количества продуктов
+    для рецептов в списке покупок пользователя.
+    Возвращает итератор по строкам списка покупок пользователя.
     """
-    sum_ingredients_in_recipes = IngredientRecipe.objects.filter(
-        recipe__shoppingcarts__user=user
+    return ShoppingListItem.objects.filter(
+        user=user
     ).values(
         'ingredient__name',
-        'ingredient__measurement_unit'
-    ).annotate(
-        amounts=Sum('amount', distinct=True)).order_by('amounts')
-    recipes_in_shopping_carts = Recipe.objects.filter(
+        'ingredient__measurement_unit',
+        amounts=F('amount')
+    ).order_by('ingredient__name').iterator()
+
+
+def shopping_cart_recipes(user):
+    """Функция получения названий рецептов в списке покупок пользователя."""
+    return Recipe.objects.filter(
         shoppingcarts__user=user
-    ).values_list(
-        'name',
-        flat=True
+    ).values_list('name', flat=True).iterator()
+
+
+def shopping_list_txt(ingredients, recipes):
+    """Функция построчной генерации списка покупок в текстовом формате."""
+    yield (
+        'Список продуктов к покупке на '
+        f'{date.today().strftime("%d-%m-%Y")}:\n'
     )
-    return '\n'.join([
-        f'Список продуктов к покупке на {date.today().strftime("%d-%m-%Y")}:',
-        *[
+    for numerate, ingredient in enumerate(ingredients, start=1):
+        yield (
             f'{numerate}) '
             f'{ingredient["ingredient__name"].capitalize()}: '
             f'{ingredient["amounts"]} '
-            f'{ingredient["ingredient__measurement_unit"]}'
-            for numerate, ingredient in enumerate(
-                sum_ingredients_in_recipes,
-                start=1
-            )
-        ],
-        '',
-        'Продукты необходимы для приготовления следующих рецептов:',
-        *[
-            f'{numerate}) {recipe}'
-            for numerate, recipe in enumerate(
-                recipes_in_shopping_carts,
-                start=1
+            f'{ingredient["ingredient__measurement_unit"]}\n'
+        )
+    yield '\nПродукты необходимы для приготовления следующих рецептов:\n'
+    for numerate, recipe in enumerate(recipes, start=1):
+        yield f'{numerate}) {recipe}\n'
+
+
+def shopping_list_csv(ingredients, recipes):
+    """Функция построчной генерации списка покупок в формате CSV."""
+    line = StringIO()
+    writer = csv.writer(line)
+    rows = chain(
+        (('Продукт', 'Количество', 'Единица измерения'),),
+        (
+            (
+                ingredient['ingredient__name'],
+                ingredient['amounts'],
+                ingredient['ingredient__measurement_unit']
             )
-        ]
-    ])
+            for ingredient in ingredients
+        )
+    )
+    for row in rows:
+        writer.writerow(row)
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+
+
+def shopping_list_json(ingredients, recipes):
+    """Функция потоковой генерации списка покупок в формате JSON."""
+    yield f'{{"date": "{date.today().isoformat()}", "ingredients": ['
+    for numerate, ingredient in enumerate(ingredients):
+        yield (',' if numerate else '') + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'amount': ingredient['amounts'],
+            'measurement_unit': ingredient['ingredient__measurement_unit']
+        }, ensure_ascii=False)
+    yield '], "recipes": ['
+    for numerate, recipe in enumerate(recipes):
+        yield (',' if numerate else '') + json.dumps(
+            recipe,
+            ensure_ascii=False
+        )
+    yield ']}'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', shopping_list_txt),
+    'csv': ('text/csv; charset=utf-8', shopping_list_csv),
+    'json': ('application/json', shopping_list_json),
+}
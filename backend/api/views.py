@@ -1,5 +1,9 @@
+from itertools import chain
+
 from django.contrib.auth import get_user_model
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as UserViewSetBase
@@ -8,20 +12,27 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import (
     AllowAny,
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
     SAFE_METHODS
 )
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import (
     ModelViewSet,
     ReadOnlyModelViewSet
 )
 
 from .filters import RecipeFilter, IngredientFilter
-from .paginations import ApiPagination
+from .ingredient_index import ingredient_index
+from .memberships import memberships
+from .metrics import request_metrics
+from .mixins import ReferenceCacheMixin
+from .paginations import ApiCursorPagination, ApiPagination
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (
+    BulkIdsSerializer,
     FavoriteSerializer,
     IngredientSerializer,
     RecipeSerializer,
@@ -32,11 +43,28 @@ from .serializers import (
     TagSerializer,
     UserSerializer
 )
-from .utils import shopping_cart_ingredients
+from .utils import (
+    BULK_ABSENT,
+    BULK_CREATED,
+    BULK_DELETED,
+    BULK_EXISTS,
+    add_recent_recipes,
+    change_shopping_lists,
+    bulk_insert_ignore,
+    bulk_results,
+    get_recipes_limit,
+    insert_ignore,
+    recipes_amounts,
+    shopping_cart_ingredients,
+    shopping_cart_recipes,
+    SHOPPING_LIST_FORMATS,
+    subscribed_authors
+)
 from recipes.models import (
     Recipe,
     Tag,
     Ingredient,
+    IngredientRecipe,
     Favorite,
     ShoppingCart,
     Subscribe
@@ -54,6 +82,16 @@ SUBSCRIBE_ERROR_VALIDATION = (
 
 RECIPE_NOT_FOUND = 'Рецепт с id={id} не найден!'
 
+IS_SUBSCRIBED_IS_TRUE = (
+    'Пользователь {user} уже подписан на пользователя {author}!'
+)
+IS_SUBSCRIBED_IS_FALSE = (
+    'Пользователь {user} не подписан на пользователя с id={author}!'
+)
+IS_SUBSCRIBED_FOR_NO_AUTHOR = (
+    'Пользователь {user} не может подписываться на самого себя!'
+)
+
 ADD_ERROR = (
     'Запись рецепта {recipe} и пользователя {user} уже есть!'
 )
@@ -64,7 +102,10 @@ NOT_FOUND = (
 SHOPPING_CART_NONE = (
     'Список покупок пользователя {user} пуст!'
 )
-DOWNLOAD_FILENAME = 'shopping_list.txt'
+DOWNLOAD_FILENAME = 'shopping_list'
+FILE_FORMAT_ERROR = 'Допустимые форматы файла: {formats}!'
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
 
 
 class UserViewSet(UserViewSetBase):
@@ -73,6 +114,21 @@ class UserViewSet(UserViewSetBase):
     serializer_class = UserSerializer
     pagination_class = ApiPagination
 
+    def get_queryset(self):
+        """
+        Функция получения пользователей с флагом подписки
+        текущего пользователя на каждого из них.
+        """
+        users = super().get_queryset()
+        if self.request.user.is_anonymous:
+            return users
+        return users.annotate(is_subscribed=Exists(
+            Subscribe.objects.filter(
+                user=self.request.user,
+                author=OuterRef('pk')
+            )
+        ))
+
     def get_permissions(self):
         if self.request.method == 'GET' and self.action == 'me':
             return (IsAuthenticated(),)
@@ -84,42 +140,123 @@ class UserViewSet(UserViewSetBase):
         permission_classes=(IsAuthenticated,)
     )
     def subscribe(self, request, *args, **kwargs):
-        """Функция создания и удаления подписки."""
+        """
+        Функция создания и удаления подписки.
+        Подписка создается запросом INSERT ... ON CONFLICT DO NOTHING,
+        удаляется одним запросом DELETE; повторные запросы безопасны.
+        """
         user = request.user
         id = self.kwargs.get('id')
-        author = get_object_or_404(User, pk=int(id))
         if request.method == 'POST':
-            serializer = SubscribeSerializer(
-                data={'user': user.id, 'author': author.id},
-                context={'request': request},
-            )
-            serializer.is_valid(raise_exception=True)
-            Subscribe.objects.create(author=author, user=user)
+            context = {
+                'request': request,
+                'recipes_limit': get_recipes_limit(request)
+            }
+            author = get_object_or_404(User, pk=id)
+            if author == user:
+                raise ValidationError(
+                    IS_SUBSCRIBED_FOR_NO_AUTHOR.format(user=user.username)
+                )
+            subscribe = Subscribe(user=user, author=author)
+            if not insert_ignore(subscribe):
+                raise ValidationError(IS_SUBSCRIBED_IS_TRUE.format(
+                    user=user.username,
+                    author=author.username
+                ))
+            memberships.invalidate(user.pk)
             return Response(
-                serializer.data,
+                SubscribeSerializer(subscribe, context=context).data,
                 status=status.HTTP_201_CREATED
             )
-        get_object_or_404(Subscribe, author=author, user=user).delete()
+        deleted, _ = Subscribe.objects.filter(user=user, author=id).delete()
+        if not deleted:
+            raise NotFound(IS_SUBSCRIBED_IS_FALSE.format(
+                user=user.username,
+                author=id
+            ))
+        memberships.invalidate(user.pk)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe',
+        url_name='subscribe-bulk'
+    )
+    @transaction.atomic
+    def subscribe_bulk(self, request):
+        """
+        Функция массового создания и удаления подписок
+        на авторов из списка "ids" с результатом для каждого автора.
+        Подписка на самого себя считается подпиской на ненайденного автора.
+        Результат определяется самой записью: добавленные подписки
+        возвращает INSERT ... RETURNING, удаляемые блокируются
+        до удаления.
+        """
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        authors = set(
+            User.objects.filter(id__in=ids).exclude(
+                pk=user.pk
+            ).values_list('id', flat=True)
+        )
+        if request.method == 'POST':
+            changed = bulk_insert_ignore(
+                Subscribe,
+                [Subscribe(user=user, author_id=id) for id in sorted(authors)],
+                'author'
+            )
+            results = bulk_results(
+                ids,
+                authors,
+                changed,
+                BULK_CREATED,
+                BULK_EXISTS
+            )
+        else:
+            changed = set(
+                Subscribe.objects.select_for_update().filter(
+                    user=user,
+                    author__in=authors
+                ).values_list('author_id', flat=True)
+            )
+            Subscribe.objects.filter(user=user, author__in=changed).delete()
+            results = bulk_results(
+                ids,
+                authors,
+                changed,
+                BULK_DELETED,
+                BULK_ABSENT
+            )
+        if changed:
+            memberships.invalidate(user.pk)
+        return Response(results)
+
     @action(
         detail=False,
         methods=('get',),
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        pagination_class=ApiCursorPagination
     )
     def subscriptions(self, request):
         """Функция получения подписок пользователя."""
-        subscribes = User.objects.filter(authors__user=request.user)
+        limit = get_recipes_limit(request)
+        subscribes = subscribed_authors(
+            User.objects.filter(authors__user=request.user)
+        ).order_by('username')
         pages = self.paginate_queryset(subscribes)
         serializer = SubscribeReadSerializer(
-            pages,
+            add_recent_recipes(pages, limit),
             many=True,
             context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
     """Вьюсет для модели тегов."""
 
     queryset = Tag.objects.all()
@@ -127,7 +264,7 @@ class TagViewSet(ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
     """Вьюсет для модели продукта."""
 
     queryset = Ingredient.objects.all()
@@ -135,12 +272,28 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+    cache_params = ('name',)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Функция получения списка продуктов.
+        Поиск по названию выполняется по индексу в памяти без запроса к БД.
+        """
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(
+            request,
+            lambda: Response(self.get_serializer(
+                ingredient_index.search(name),
+                many=True
+            ).data)
+        )
 
 
 class RecipeViewSet(ModelViewSet):
     """Вьюсет для модели рецепта."""
 
-    queryset = Recipe.objects.all()
     permission_classes = (
         IsAuthorOrReadOnly,
         IsAuthenticatedOrReadOnly
@@ -148,7 +301,67 @@ class RecipeViewSet(ModelViewSet):
     http_method_names = ('get', 'head', 'options', 'patch', 'post', 'delete')
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = ApiPagination
+    pagination_class = ApiCursorPagination
+
+    def get_queryset(self):
+        """
+        Функция получения рецептов с заранее загруженными связанными
+        объектами и флагами избранного, списка покупок и подписки
+        для текущего пользователя.
+        Флаги берутся из кэша множеств пользователя, а если множества
+        слишком велики для кэша - из подзапросов EXISTS.
+        Число запросов к БД не зависит от количества рецептов на странице.
+        Для записи связанные объекты не загружаются: ответ на изменение
+        загружает их заново после сохранения (RecipeSerializer).
+        """
+        user = self.request.user
+        recipes = Recipe.objects.defer('search_vector')
+        if self.action not in ('list', 'retrieve'):
+            return recipes.select_related('author')
+        recipes = recipes.prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_recipes',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            )
+        )
+        if user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return recipes.select_related('author').annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false
+            )
+        if memberships.complete(self.request):
+            return recipes.select_related('author')
+        return recipes.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=Exists(
+                    Subscribe.objects.filter(user=user, author=OuterRef('pk'))
+                )).order_by()
+            )
+        ).annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            )
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, recipe):
+        """
+        Функция удаления рецепта.
+        Продукты рецепта вычитаются из списков покупок пользователей.
+        """
+        change_shopping_lists(
+            ShoppingCart.objects.filter(
+                recipe=recipe
+            ).values_list('user', flat=True),
+            recipes_amounts((recipe,), sign=-1)
+        )
+        recipe.delete()
 
     def get_serializer_class(self):
         """Функция выбора сериализатора в зависимости от метода запроса."""
@@ -156,34 +369,98 @@ class RecipeViewSet(ModelViewSet):
             return RecipeReadSerializer
         return RecipeSerializer
 
+    @transaction.atomic
     def add_or_delete_recipe_for_user(self, model, serializer, request, id):
         """
         Функция добавления записи в промежуточную таблицу или ее удаления,
         связанной с избранными рецептами и списком покупок
         для переданной модели текущего пользователя.
+        Запись добавляется запросом INSERT ... ON CONFLICT DO NOTHING,
+        удаляется одним запросом DELETE; повторные запросы безопасны.
+        Для списка покупок меняются суммы продуктов пользователя.
         """
         user = request.user
-        recipe = get_object_or_404(Recipe, id=id)
         if request.method == 'POST':
-            _, created = model.objects.get_or_create(
-                user=user,
-                recipe=recipe
-            )
-            if created:
-                serializer = serializer(recipe)
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED
+            recipe = get_object_or_404(Recipe, id=id)
+            if not insert_ignore(model(user=user, recipe=recipe)):
+                raise ValidationError(
+                    detail={'errors': ADD_ERROR.format(
+                        recipe=recipe.name,
+                        user=user.username
+                    )}
                 )
-            raise ValidationError(
-                detail={'errors': ADD_ERROR.format(
-                    recipe=recipe.name,
-                    user=user.username
-                )}
+            memberships.invalidate(user.pk)
+            if model is ShoppingCart:
+                change_shopping_lists((user.pk,), recipes_amounts((recipe,)))
+            return Response(
+                serializer(recipe).data,
+                status=status.HTTP_201_CREATED
+            )
+        deleted, _ = model.objects.filter(user=user, recipe=id).delete()
+        if not deleted:
+            raise NotFound(NOT_FOUND.format(recipe=id, user=user.username))
+        memberships.invalidate(user.pk)
+        if model is ShoppingCart:
+            change_shopping_lists(
+                (user.pk,),
+                recipes_amounts((id,), sign=-1)
             )
-        get_object_or_404(model, user=user, recipe=recipe).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @transaction.atomic
+    def bulk_add_or_delete_recipes_for_user(self, model, request):
+        """
+        Функция массового добавления или удаления рецептов из списка "ids"
+        в избранное или список покупок текущего пользователя
+        с результатом для каждого рецепта.
+        """
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        recipes = set(
+            Recipe.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        if request.method == 'POST':
+            changed = bulk_insert_ignore(
+                model,
+                [model(user=user, recipe_id=id) for id in sorted(recipes)],
+                'recipe'
+            )
+            results = bulk_results(
+                ids,
+                recipes,
+                changed,
+                BULK_CREATED,
+                BULK_EXISTS
+            )
+        else:
+            changed = set(
+                model.objects.select_for_update().filter(
+                    user=user,
+                    recipe__in=recipes
+                ).values_list('recipe_id', flat=True)
+            )
+            model.objects.filter(user=user, recipe__in=changed).delete()
+            results = bulk_results(
+                ids,
+                recipes,
+                changed,
+                BULK_DELETED,
+                BULK_ABSENT
+            )
+        if changed:
+            memberships.invalidate(user.pk)
+        if model is ShoppingCart and changed:
+            change_shopping_lists(
+                (user.pk,),
+                recipes_amounts(
+                    changed,
+                    sign=1 if request.method == 'POST' else -1
+                )
+            )
+        return Response(results)
+
     @action(
         detail=True,
         methods=('post', 'delete'),
@@ -218,22 +495,81 @@ class RecipeViewSet(ModelViewSet):
             kwargs.get('pk')
         )
 
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite',
+        url_name='favorite-bulk'
+    )
+    def favorite_bulk(self, request):
+        """Функция массового изменения избранных рецептов."""
+        return self.bulk_add_or_delete_recipes_for_user(Favorite, request)
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk'
+    )
+    def shopping_cart_bulk(self, request):
+        """Функция массового изменения списка покупок."""
+        return self.bulk_add_or_delete_recipes_for_user(
+            ShoppingCart,
+            request
+        )
+
     @action(
         detail=False,
         methods=('get',),
         permission_classes=(IsAuthenticated,)
     )
     def download_shopping_cart(self, request, *args, **kwargs):
-        """Функция скачивания списка покупок."""
-        user = User.objects.get(id=request.user.pk)
-        if user.shoppingcarts.exists():
-            return FileResponse(
-                shopping_cart_ingredients(request.user),
-                as_attachment=True,
-                filename=DOWNLOAD_FILENAME
-            )
-        raise NotFound(
-            detail=SHOPPING_CART_NONE.format(
-                user=user.username
+        """
+        Функция скачивания списка покупок.
+        Формат файла (txt, csv, json) задается параметром "file_format",
+        файл передается потоком по мере чтения строк из БД.
+        """
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            raise ValidationError(
+                {'file_format': FILE_FORMAT_ERROR.format(
+                    formats=', '.join(SHOPPING_LIST_FORMATS)
+                )}
+            )
+        ingredients = shopping_cart_ingredients(request.user)
+        first_ingredient = next(ingredients, None)
+        if first_ingredient is None:
+            raise NotFound(
+                detail=SHOPPING_CART_NONE.format(
+                    user=request.user.username
+                ),
+            )
+        content_type, shopping_list = SHOPPING_LIST_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            shopping_list(
+                chain((first_ingredient,), ingredients),
+                shopping_cart_recipes(request.user)
             ),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{DOWNLOAD_FILENAME}.{file_format}"'
+        )
+        return response
+
+
+class MetricsView(APIView):
+    """
+    Класс выгрузки метрик запросов процесса в формате Prometheus.
+    Доступно только администратору.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            request_metrics.render(),
+            content_type=METRICS_CONTENT_TYPE
         )
@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
 
 import os
+import tempfile
 from pathlib import Path
 
 
@@ -34,11 +35,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,6 +89,55 @@ else:
     }
 
 
+# Cache
+# Вне режима отладки кэш по умолчанию - файловый: он общий для процессов
+# gunicorn и команд manage.py в контейнере (версии справочников).
+
+if DEBUG:
+    DEFAULT_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+    DEFAULT_CACHE_LOCATION = ''
+else:
+    DEFAULT_CACHE_BACKEND = (
+        'django.core.cache.backends.filebased.FileBasedCache'
+    )
+    DEFAULT_CACHE_LOCATION = os.path.join(
+        tempfile.gettempdir(),
+        'foodgram_cache'
+    )
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', DEFAULT_CACHE_BACKEND)
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', DEFAULT_CACHE_LOCATION)
+
+# Файловый кэш и кэш в памяти ограничивают число записей в своем
+# расположении, поэтому множества избранного, списков покупок и подписок
+# хранятся в отдельном расположении со своим ограничением.
+MEMBERSHIP_CACHE = 'memberships'
+MEMBERSHIP_CACHE_TTL = 300
+MEMBERSHIP_CACHE_SIZE = 10000
+MEMBERSHIP_CACHE_MAX_IDS = 5000
+MEMBERSHIP_CACHE_LOCATION = os.getenv(
+    'MEMBERSHIP_CACHE_LOCATION',
+    f'{CACHE_LOCATION}_memberships' if CACHE_BACKEND in (
+        'django.core.cache.backends.filebased.FileBasedCache',
+        'django.core.cache.backends.locmem.LocMemCache',
+    ) else CACHE_LOCATION
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    },
+    MEMBERSHIP_CACHE: {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': MEMBERSHIP_CACHE_LOCATION,
+        'KEY_PREFIX': MEMBERSHIP_CACHE,
+        'TIMEOUT': MEMBERSHIP_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': MEMBERSHIP_CACHE_SIZE},
+    },
+}
+
+
 # Password validation
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -128,6 +180,8 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'backend_static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
 
 # Default primary key field type
 
@@ -182,3 +236,51 @@ MAX_LENGTH_SLUG = 200
 
 MAX_LENGTH_NAME_INGREDIENT = 200
 MAX_LENGTH_MEASUREMENT_UNIT = 200
+
+MAX_PAGE_SIZE = 100
+
+PAGINATION_COUNT = {
+    'DEFAULT': 'exact',
+    'recipes': 'approximate',
+}
+PAGINATION_COUNT_CAP = 1000
+PAGINATION_COUNT_CACHE_TTL = 60
+
+MAX_RECIPES_LIMIT = 100
+
+MAX_BULK_SIZE = 100
+
+INGREDIENT_INDEX_TTL = 3600
+TAG_INDEX_TTL = 300
+
+REFERENCE_CACHE_TTL = 3600
+
+IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640)
+IMAGE_DERIVATIVE_WORKERS = 2
+
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+MAX_DECODED_IMAGE_PIXELS = 16_000_000
+MAX_IMAGE_SIDE = 2048
+
+SEARCH_CONFIG = 'russian'
+
+METRICS_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.2))
+SLOW_QUERY_EXPLAIN_ANALYZE = bool(
+    os.getenv('SLOW_QUERY_EXPLAIN_ANALYZE', False)
+)
+SLOW_QUERY_LOG_SIZE = 200
+SLOW_QUERY_LOG_FILE = os.getenv('SLOW_QUERY_LOG_FILE')
+SLOW_QUERY_LOG_PARAMS = bool(os.getenv('SLOW_QUERY_LOG_PARAMS', False))
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DIR = os.getenv(
+    'PROFILING_DIR',
+    os.path.join(tempfile.gettempdir(), 'foodgram_profiles')
+)
+PROFILING_MAX_FILES = 500
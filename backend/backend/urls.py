@@ -3,8 +3,15 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from api.admin import slow_queries_view
+
 
 urlpatterns = [
+    path(
+        'admin/slow-queries/',
+        admin.site.admin_view(slow_queries_view),
+        name='slow-queries'
+    ),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     # path(
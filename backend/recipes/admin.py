@@ -10,9 +10,12 @@ from .models import (
     Favorite,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Subscribe,
     Tag,
 )
+from .search import update_search_vectors
+from api.memberships import memberships
 
 
 User = get_user_model()
@@ -57,8 +60,31 @@ class UserAdmin(UserAdminBase):
         return user.signers.count()
 
 
+class MembershipAdmin(admin.ModelAdmin):
+    """
+    Базовая админ-зона связей пользователя с рецептами и авторами.
+    После изменения связей сбрасывается кэш множеств пользователей.
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        memberships.invalidate(obj.user_id)
+        if change and 'user' in form.changed_data:
+            memberships.invalidate(form.initial['user'])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        memberships.invalidate(obj.user_id)
+
+    def delete_queryset(self, request, queryset):
+        users = set(queryset.values_list('user', flat=True))
+        super().delete_queryset(request, queryset)
+        for user in users:
+            memberships.invalidate(user)
+
+
 @admin.register(Subscribe)
-class SubscribeAdmin(admin.ModelAdmin):
+class SubscribeAdmin(MembershipAdmin):
     """Админ-зона для подписок."""
 
     list_display = ('author', 'user')
@@ -118,6 +144,10 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInline,)
     readonly_fields = ('image_display',)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_vectors(Recipe.objects.filter(pk=form.instance.pk))
+
     @admin.display(description='Теги')
     def display_tags(self, recipe):
         return mark_safe('<br>'.join(tag.name for tag in recipe.tags.all()))
@@ -154,7 +184,7 @@ class IngredientRecipeAdmin(admin.ModelAdmin):
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(MembershipAdmin):
     """Админ-зона для списков покупок."""
 
     list_display = ('user', 'recipe')
@@ -162,8 +192,17 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     search_fields = ('user', 'recipe')
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """Админ-зона для продуктов списков покупок."""
+
+    list_display = ('user', 'ingredient', 'amount')
+    list_filter = ('user',)
+    search_fields = ('user__username', 'ingredient__name')
+
+
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(MembershipAdmin):
     """Админ-зона для избранных рецептов."""
 
     list_display = ('user', 'recipe')
@@ -0,0 +1,154 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+Image.MAX_IMAGE_PIXELS = settings.MAX_IMAGE_PIXELS
+
+INGEST_FORMATS = {
+    'JPEG': {'quality': 90},
+    'PNG': {'optimize': True},
+    'GIF': {},
+    'WEBP': {'quality': 90},
+}
+
+DRAFT_FORMATS = ('JPEG',)
+
+DERIVATIVES_DIR = 'recipe/derivatives'
+DERIVATIVE_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+ALPHA_FORMATS = ('WEBP',)
+ALPHA_MODES = ('RGBA', 'LA', 'PA')
+BACKGROUND = 'white'
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+    thread_name_prefix='image-derivatives'
+)
+
+
+def max_pixels(image_format):
+    """
+    Функция получения допустимого числа пикселей изображения.
+    Для JPEG это MAX_IMAGE_PIXELS: при уменьшении он декодируется
+    сразу в уменьшенном масштабе (draft). Остальные форматы
+    декодируются полностью и ограничены MAX_DECODED_IMAGE_PIXELS.
+    """
+    if image_format in DRAFT_FORMATS:
+        return settings.MAX_IMAGE_PIXELS
+    return settings.MAX_DECODED_IMAGE_PIXELS
+
+
+def downscale_image(upload, image_format):
+    """
+    Функция уменьшения загруженного изображения, большая сторона
+    которого превышает MAX_IMAGE_SIDE.
+    JPEG декодируется сразу в уменьшенном масштабе, результат
+    записывается во временный файл на диске.
+    Изображения допустимого размера возвращаются без изменений.
+    """
+    side = settings.MAX_IMAGE_SIDE
+    upload.seek(0)
+    image = Image.open(upload)
+    if max(image.size) <= side:
+        upload.seek(0)
+        return upload
+    image.draft(None, (side, side))
+    image.thumbnail((side, side))
+    image = ImageOps.exif_transpose(image)
+    result = TemporaryUploadedFile(upload.name, upload.content_type, 0, None)
+    image.save(result, image_format, **INGEST_FORMATS[image_format])
+    result.size = result.tell()
+    result.seek(0)
+    upload.close()
+    return result
+
+
+def has_alpha(image):
+    return image.mode in ALPHA_MODES or 'transparency' in image.info
+
+
+def flatten(image):
+    """
+    Функция наложения изображения с прозрачностью на фон BACKGROUND
+    для форматов без прозрачности.
+    """
+    if image.mode == 'RGB':
+        return image
+    background = Image.new('RGB', image.size, BACKGROUND)
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def make_derivatives(recipe_id, image_name):
+    """
+    Функция создания уменьшенных копий изображения рецепта
+    в форматах JPEG и WebP для ширин из IMAGE_DERIVATIVE_WIDTHS.
+    Прозрачность сохраняется в форматах ALPHA_FORMATS, в остальных
+    прозрачные области заполняются фоном BACKGROUND.
+    Имена копий сохраняются в рецепте, только если его изображение
+    не сменилось за время обработки.
+    """
+    storage = Recipe._meta.get_field('image').storage
+    with storage.open(image_name) as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    opaque = flatten(image)
+    stem = PurePosixPath(image_name).stem
+    derivatives = {}
+    for image_format, (pil_format, extension, options) in (
+        DERIVATIVE_FORMATS.items()
+    ):
+        source = image if pil_format in ALPHA_FORMATS else opaque
+        derivatives[image_format] = {}
+        for width in settings.IMAGE_DERIVATIVE_WIDTHS:
+            derivative = source.copy()
+            derivative.thumbnail((width, source.height))
+            content = BytesIO()
+            derivative.save(content, pil_format, **options)
+            derivatives[image_format][str(width)] = storage.save(
+                f'{DERIVATIVES_DIR}/{stem}_{width}.{extension}',
+                ContentFile(content.getvalue())
+            )
+    Recipe.objects.filter(
+        pk=recipe_id,
+        image=image_name
+    ).update(image_derivatives=derivatives)
+
+
+def run_derivatives(recipe_id, image_name):
+    try:
+        make_derivatives(recipe_id, image_name)
+    except Exception:
+        logger.exception(
+            'Не удалось создать копии изображения %s рецепта %s.',
+            image_name,
+            recipe_id
+        )
+    finally:
+        connections.close_all()
+
+
+def schedule_derivatives(recipe):
+    """
+    Функция постановки создания копий изображения рецепта
+    в пул фоновых потоков после фиксации транзакции.
+    """
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(run_derivatives, recipe_id, image_name)
+    )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import make_derivatives
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает уменьшенные копии изображений рецептов, '
+        'для которых они еще не созданы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.only('id', 'image')
+        if not options['all']:
+            recipes = recipes.filter(image_derivatives={})
+        count = 0
+        for recipe in recipes.iterator():
+            make_derivatives(recipe.pk, recipe.image.name)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Созданы копии изображений {count} рецептов.'
+        ))
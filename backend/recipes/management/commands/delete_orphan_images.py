@@ -0,0 +1,124 @@
+from datetime import timedelta
+from math import ceil
+from zlib import crc32
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import DERIVATIVE_FORMATS, DERIVATIVES_DIR
+from recipes.models import Recipe
+
+
+CHUNK_SIZE = 2000
+MAX_NAMES = 1_000_000
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы изображений рецептов и их копий, '
+        'на которые не ссылается ни один рецепт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help=(
+                'Не удалять файлы, измененные менее указанного '
+                'числа минут назад (загружаемые сейчас).'
+            )
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только вывести файлы, не удаляя их.'
+        )
+        parser.add_argument(
+            '--max-names',
+            type=int,
+            default=MAX_NAMES,
+            help=(
+                'Наибольшее число имен файлов рецептов в памяти: при '
+                'большем числе файлы проверяются в несколько проходов.'
+            )
+        )
+
+    @staticmethod
+    def part(name, parts):
+        """Функция определения части файлов, к которой относится имя."""
+        return crc32(name.encode()) % parts
+
+    @classmethod
+    def referenced_names(cls, parts, part):
+        """
+        Функция получения имен файлов части part из parts,
+        на которые ссылаются рецепты.
+        Таблица рецептов читается частями по CHUNK_SIZE записей.
+        """
+        names = set()
+        for image, derivatives in Recipe.objects.values_list(
+            'image',
+            'image_derivatives'
+        ).order_by().iterator(chunk_size=CHUNK_SIZE):
+            for name in (
+                image,
+                *(
+                    name for widths in derivatives.values()
+                    for name in widths.values()
+                )
+            ):
+                if cls.part(name, parts) == part:
+                    names.add(name)
+        return names
+
+    @staticmethod
+    def count_parts(max_names):
+        """
+        Функция подсчета проходов, в каждом из которых в памяти
+        не больше max_names имен файлов (оценка по числу рецептов).
+        """
+        names_per_recipe = 1 + len(DERIVATIVE_FORMATS) * len(
+            settings.IMAGE_DERIVATIVE_WIDTHS
+        )
+        return max(
+            1,
+            ceil(Recipe.objects.count() * names_per_recipe / max_names)
+        )
+
+    @classmethod
+    def walk(cls, storage, directory):
+        directories, files = storage.listdir(directory)
+        for file in files:
+            yield f'{directory}/{file}'
+        for subdirectory in directories:
+            yield from cls.walk(storage, f'{directory}/{subdirectory}')
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        deadline = timezone.now() - timedelta(minutes=options['min_age'])
+        parts = self.count_parts(options['max_names'])
+        count = 0
+        for part in range(parts):
+            referenced = self.referenced_names(parts, part)
+            for directory in (field.upload_to.rstrip('/'), DERIVATIVES_DIR):
+                if not storage.exists(directory):
+                    continue
+                for name in self.walk(storage, directory):
+                    if (
+                        self.part(name, parts) != part
+                        or name in referenced
+                        or storage.get_modified_time(name) > deadline
+                    ):
+                        continue
+                    if options['dry_run']:
+                        self.stdout.write(name)
+                    else:
+                        storage.delete(name)
+                    count += 1
+        action = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} неиспользуемых файлов: {count}.'
+        ))
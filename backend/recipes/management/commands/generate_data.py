@@ -0,0 +1,296 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO, StringIO
+from itertools import accumulate, islice
+from time import monotonic
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Subscribe,
+    Tag,
+    User
+)
+from recipes.search import update_search_vectors
+
+
+NO_REFERENCES = (
+    'Нет продуктов или тегов. Сначала загрузите справочники '
+    '(data/ingredients.json, data/tags.json).'
+)
+USERS_EXIST = (
+    'Пользователи с префиксом {prefix} уже созданы. '
+    'Укажите другое значение --seed.'
+)
+
+WORDS = (
+    'быстро', 'вкусно', 'нарезать', 'смешать', 'добавить', 'обжарить',
+    'запечь', 'подавать', 'горячим', 'охладить', 'посолить', 'поперчить',
+    'перемешать', 'довести', 'до', 'кипения', 'на', 'сковороде', 'в',
+    'духовке', 'минут', 'соус', 'тесто', 'начинка', 'сверху', 'слоями',
+)
+
+
+class PowerLaw:
+    """
+    Выбор элементов с вероятностью, обратно пропорциональной
+    рангу элемента в степени exponent (закон Ципфа).
+    Ранги назначаются элементам в случайном порядке.
+    """
+
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+        self.rng = rng
+
+    def choice(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def sample(self, count):
+        """Функция выбора count различных элементов."""
+        count = min(count, len(self.items))
+        chosen = {}
+        while len(chosen) < count:
+            chosen.update(dict.fromkeys(self.rng.choices(
+                self.items,
+                cum_weights=self.cum_weights,
+                k=count - len(chosen)
+            )))
+        return list(chosen)
+
+
+@contextmanager
+def keep_created_at(model):
+    """
+    Контекстный менеджер отключения auto_now_add поля created_at,
+    чтобы bulk_create сохранил заданные даты создания.
+    """
+    field = model._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает синтетические данные для нагрузочного тестирования: '
+        'пользователей, рецепты с продуктами и тегами, избранное, '
+        'списки покупок и подписки. Популярность авторов, рецептов, '
+        'продуктов и тегов подчиняется степенному закону, результат '
+        'определяется значением --seed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites',
+            type=float,
+            default=20,
+            help='Среднее число избранных рецептов пользователя.'
+        )
+        parser.add_argument(
+            '--cart',
+            type=float,
+            default=3,
+            help='Среднее число рецептов в списке покупок пользователя.'
+        )
+        parser.add_argument(
+            '--subscriptions',
+            type=float,
+            default=10,
+            help='Среднее число подписок пользователя.'
+        )
+        parser.add_argument(
+            '--exponent',
+            type=float,
+            default=1.1,
+            help='Показатель степенного закона популярности.'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Период дат создания рецептов в днях.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--password',
+            default='password',
+            help='Пароль всех созданных пользователей.'
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.exponent = options['exponent']
+        ingredients = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        tags = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+        if not ingredients or not tags:
+            raise CommandError(NO_REFERENCES)
+        prefix = f'load{options["seed"]}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(USERS_EXIST.format(prefix=prefix))
+        self.started = monotonic()
+        with transaction.atomic():
+            users = self.create_users(
+                prefix,
+                options['users'],
+                options['password']
+            )
+            authors = PowerLaw(users, self.exponent, self.rng)
+            recipes = self.create_recipes(
+                authors,
+                options['recipes'],
+                options['days']
+            )
+            self.create_recipe_relations(recipes, ingredients, tags)
+            popular = PowerLaw(recipes, self.exponent, self.rng)
+            self.create_user_relations(Favorite, 'recipe', users, popular,
+                                       options['favorites'])
+            self.create_user_relations(ShoppingCart, 'recipe', users,
+                                       popular, options['cart'])
+            self.create_user_relations(Subscribe, 'author', users, authors,
+                                       options['subscriptions'])
+            call_command('rebuild_shopping_lists', stdout=StringIO())
+            if recipes:
+                update_search_vectors(
+                    Recipe.objects.filter(pk__gte=recipes[0])
+                )
+        self.report('Готово')
+
+    def report(self, message):
+        self.stdout.write(self.style.SUCCESS(
+            f'{message} ({monotonic() - self.started:.1f} с).'
+        ))
+
+    def bulk_create(self, model, objects, label=None):
+        """Функция создания объектов пачками по batch_size."""
+        count = 0
+        while batch := list(islice(objects, self.batch_size)):
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        self.report(f'{label or model._meta.verbose_name_plural}: {count}')
+        return count
+
+    @staticmethod
+    def new_ids(model, last_id):
+        """
+        Функция получения id созданных объектов: SQLite
+        не возвращает первичные ключи из bulk_create.
+        """
+        return list(
+            model.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+                'pk',
+                flat=True
+            )
+        )
+
+    @staticmethod
+    def last_id(model):
+        return model.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+
+    def create_users(self, prefix, count, password):
+        last_id = self.last_id(User)
+        password = make_password(password)
+        self.bulk_create(User, (
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password
+            )
+            for number in range(count)
+        ))
+        return self.new_ids(User, last_id)
+
+    @staticmethod
+    def placeholder_image():
+        content = BytesIO()
+        Image.new('RGB', (640, 480), '#E26C2D').save(content, 'JPEG')
+        return Recipe._meta.get_field('image').storage.save(
+            'recipe/images/generated.jpg',
+            ContentFile(content.getvalue())
+        )
+
+    def create_recipes(self, authors, count, days):
+        last_id = self.last_id(Recipe)
+        image = self.placeholder_image()
+        now = timezone.now()
+        rng = self.rng
+        with keep_created_at(Recipe):
+            self.bulk_create(Recipe, (
+                Recipe(
+                    author_id=authors.choice(),
+                    name=f'Рецепт {number}',
+                    text=' '.join(rng.choices(WORDS, k=rng.randint(10, 60))),
+                    cooking_time=rng.randint(5, 180),
+                    image=image,
+                    created_at=now - timedelta(
+                        seconds=rng.randint(0, days * 24 * 60 * 60)
+                    )
+                )
+                for number in range(count)
+            ))
+        return self.new_ids(Recipe, last_id)
+
+    def create_recipe_relations(self, recipes, ingredients, tags):
+        ingredients = PowerLaw(ingredients, self.exponent, self.rng)
+        tags = PowerLaw(tags, self.exponent, self.rng)
+        rng = self.rng
+        self.bulk_create(IngredientRecipe, (
+            IngredientRecipe(
+                recipe_id=recipe,
+                ingredient_id=ingredient,
+                amount=rng.randint(1, 500)
+            )
+            for recipe in recipes
+            for ingredient in ingredients.sample(rng.randint(3, 12))
+        ))
+        self.bulk_create(
+            Recipe.tags.through,
+            (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in tags.sample(rng.randint(1, 3))
+            ),
+            label='Теги рецептов'
+        )
+
+    def create_user_relations(self, model, field, users, targets, mean):
+        """
+        Функция создания связей пользователей с рецептами или авторами.
+        Число связей пользователя распределено экспоненциально
+        со средним mean, цели выбираются по популярности.
+        """
+        if mean <= 0:
+            return
+        rng = self.rng
+        self.bulk_create(model, (
+            model(user_id=user, **{f'{field}_id': target})
+            for user in users
+            for target in targets.sample(round(rng.expovariate(1 / mean)))
+            if model is not Subscribe or target != user
+        ))
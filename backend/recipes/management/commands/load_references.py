@@ -0,0 +1,294 @@
+import csv
+import json
+from io import StringIO
+from itertools import islice
+from pathlib import Path
+from time import monotonic
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.checks import PROCESS_LOCAL_CACHES
+from api.mixins import update_reference_version
+from recipes.models import Ingredient, Tag
+
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+# Поля справочников и поля, по которым определяется совпадение записей.
+REFERENCES = {
+    'ingredients': (
+        Ingredient,
+        ('name', 'measurement_unit'),
+        ('name', 'measurement_unit')
+    ),
+    'tags': (Tag, ('name', 'color', 'slug'), ('slug',)),
+}
+
+FILE_NOT_FOUND = 'Файл {path} не найден!'
+UNKNOWN_FORMAT = 'Формат файла {path} не поддерживается (JSON, CSV)!'
+INVALID_JSON = 'Файл {path} должен содержать JSON-массив объектов!'
+MISSING_FIELDS = 'В записи {row} файла {path} нет полей {fields}!'
+RESTART_REQUIRED = (
+    'Кэш {backend} не общий для процессов: запущенные серверы не увидят '
+    'новую версию справочников до перезапуска.'
+)
+
+
+def read_json_array(file, path):
+    """
+    Функция потокового чтения объектов JSON-массива:
+    в памяти хранится только текущий фрагмент файла.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError(INVALID_JSON.format(path=path))
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError(INVALID_JSON.format(path=path))
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if not isinstance(item, dict):
+            raise CommandError(INVALID_JSON.format(path=path))
+        yield item.get('fields', item)
+
+
+def read_rows(path, fields):
+    """
+    Функция потокового чтения записей справочника из файла JSON
+    (в формате фикстуры Django или массива объектов) или CSV
+    (с заголовком или без него, с полями в порядке fields).
+    """
+    path = Path(path)
+    if not path.exists():
+        raise CommandError(FILE_NOT_FOUND.format(path=path))
+    suffix = path.suffix.lower()
+    if suffix not in ('.json', '.csv'):
+        raise CommandError(UNKNOWN_FORMAT.format(path=path))
+    with open(path, encoding='utf-8', newline='') as file:
+        if suffix == '.json':
+            rows = read_json_array(file, path)
+        else:
+            rows = (
+                dict(zip(fields, row))
+                for row in csv.reader(file) if row and row != list(fields)
+            )
+        for number, row in enumerate(rows, 1):
+            missing = [field for field in fields if field not in row]
+            if missing:
+                raise CommandError(MISSING_FIELDS.format(
+                    row=number,
+                    path=path,
+                    fields=missing
+                ))
+            yield tuple(str(row[field]) for field in fields)
+
+
+def unique_rows(rows, fields, key_fields):
+    """Функция пропуска записей с уже встречавшимся ключом."""
+    key_indexes = [fields.index(field) for field in key_fields]
+    seen = set()
+    for row in rows:
+        key = tuple(row[index] for index in key_indexes)
+        if key not in seen:
+            seen.add(key)
+            yield row
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает справочники продуктов и тегов из файлов JSON или CSV. '
+        'Новые записи добавляются, измененные обновляются (совпадение '
+        'продуктов - по названию и единице измерения, тегов - по слагу); '
+        'повторный запуск не создает дубликатов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            type=Path,
+            help='Файл продуктов (по умолчанию data/ingredients.json).'
+        )
+        parser.add_argument(
+            '--tags',
+            type=Path,
+            help='Файл тегов (по умолчанию data/tags.json).'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        paths = {
+            kind: options[kind]
+            for kind in REFERENCES if options[kind] is not None
+        } or {
+            kind: Path(settings.BASE_DIR) / 'data' / f'{kind}.json'
+            for kind in REFERENCES
+        }
+        changed = False
+        for kind, path in paths.items():
+            model, fields, key_fields = REFERENCES[kind]
+            started = monotonic()
+            rows = unique_rows(read_rows(path, fields), fields, key_fields)
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    counts = self.copy_upsert(model, fields, key_fields, rows)
+                else:
+                    counts = self.batch_upsert(
+                        model, fields, key_fields, rows,
+                        options['batch_size']
+                    )
+            inserted, updated, unchanged = counts
+            if inserted or updated:
+                update_reference_version(model)
+                changed = True
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural} ({path}): '
+                f'добавлено {inserted}, обновлено {updated}, '
+                f'без изменений {unchanged} '
+                f'({monotonic() - started:.2f} с).'
+            ))
+        backend = settings.CACHES['default']['BACKEND']
+        if changed and backend in PROCESS_LOCAL_CACHES:
+            self.stderr.write(self.style.WARNING(
+                RESTART_REQUIRED.format(backend=backend)
+            ))
+
+    @staticmethod
+    def copy_upsert(model, fields, key_fields, rows):
+        """
+        Функция загрузки записей в PostgreSQL: записи копируются
+        командой COPY во временную таблицу, затем одним запросом
+        обновляются измененные и одним запросом добавляются новые.
+        """
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        staging = quote(f'{model._meta.db_table}_staging')
+        columns = ', '.join(quote(field) for field in fields)
+        values = [field for field in fields if field not in key_fields]
+        match = ' AND '.join(
+            f'target.{quote(field)} = staging.{quote(field)}'
+            for field in key_fields
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {staging} ON COMMIT DROP '
+                f'AS SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.copy_expert(
+                f'COPY {staging} ({columns}) FROM STDIN '
+                f'WITH (FORMAT csv)',
+                CsvStream(rows)
+            )
+            cursor.execute(f'SELECT count(*) FROM {staging}')
+            total = cursor.fetchone()[0]
+            updated = 0
+            if values:
+                cursor.execute(
+                    f'UPDATE {table} AS target SET '
+                    + ', '.join(
+                        f'{quote(field)} = staging.{quote(field)}'
+                        for field in values
+                    )
+                    + f' FROM {staging} AS staging WHERE {match} AND ROW('
+                    + ', '.join(f'target.{quote(field)}' for field in values)
+                    + ') IS DISTINCT FROM ROW('
+                    + ', '.join(f'staging.{quote(field)}' for field in values)
+                    + ')'
+                )
+                updated = cursor.rowcount
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM {staging} AS staging '
+                f'WHERE NOT EXISTS (SELECT 1 FROM {table} AS target '
+                f'WHERE {match}) ON CONFLICT DO NOTHING'
+            )
+            inserted = cursor.rowcount
+            # ON COMMIT DROP не срабатывает, если команда выполняется
+            # во внешней транзакции (atomic здесь - точка сохранения).
+            cursor.execute(f'DROP TABLE {staging}')
+        return inserted, updated, total - inserted - updated
+
+    @staticmethod
+    def batch_upsert(model, fields, key_fields, rows, batch_size):
+        """
+        Функция загрузки записей пачками через ORM (для СУБД без COPY):
+        на пачку - запрос существующих записей, массовые
+        добавление и обновление.
+        """
+        values = [field for field in fields if field not in key_fields]
+        inserted = updated = unchanged = 0
+        while batch := list(islice(rows, batch_size)):
+            objects = [model(**dict(zip(fields, row))) for row in batch]
+            existing = {
+                tuple(getattr(item, field) for field in key_fields): item
+                for item in model.objects.filter(**{
+                    f'{key_fields[0]}__in': {
+                        getattr(item, key_fields[0]) for item in objects
+                    }
+                })
+            }
+            new, changed = [], []
+            for item in objects:
+                current = existing.get(
+                    tuple(getattr(item, field) for field in key_fields)
+                )
+                if current is None:
+                    new.append(item)
+                elif any(
+                    getattr(current, field) != getattr(item, field)
+                    for field in values
+                ):
+                    for field in values:
+                        setattr(current, field, getattr(item, field))
+                    changed.append(current)
+            model.objects.bulk_create(new)
+            if changed:
+                model.objects.bulk_update(changed, values)
+            inserted += len(new)
+            updated += len(changed)
+            unchanged += len(batch) - len(new) - len(changed)
+        return inserted, updated, unchanged
+
+
+class CsvStream:
+    """
+    Файлоподобный объект для COPY: строки CSV формируются
+    из записей по мере чтения.
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        output = StringIO()
+        writer = csv.writer(
+            output,
+            quoting=csv.QUOTE_ALL,
+            lineterminator='\n'
+        )
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            writer.writerow(row)
+            self.buffer += output.getvalue()
+            output.seek(0)
+            output.truncate()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
@@ -0,0 +1,84 @@
+import pstats
+from io import StringIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.profiling import PROFILE_NAME, request_profiler
+
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+NO_PROFILES = 'Профили не найдены.'
+
+
+class Command(BaseCommand):
+    help = (
+        'Выводит список сохраненных профилей запросов '
+        'и сводную статистику по выбранным профилям.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help='Имена файлов профилей (по умолчанию - все).'
+        )
+        parser.add_argument(
+            '--view',
+            help='Отбор по имени вьюсета, например RecipeViewSet.'
+        )
+        parser.add_argument(
+            '--action',
+            help='Отбор по действию, например list.'
+        )
+        parser.add_argument(
+            '--summary',
+            action='store_true',
+            help='Вывести сводную статистику по отобранным профилям.'
+        )
+        parser.add_argument(
+            '--sort',
+            choices=SORT_KEYS,
+            default='cumulative',
+            help='Сортировка функций в сводной статистике.'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=30,
+            help='Число функций в сводной статистике.'
+        )
+
+    @staticmethod
+    def select(options):
+        """Функция отбора профилей по именам, вьюсету и действию."""
+        profiles = []
+        for path in request_profiler.files():
+            match = PROFILE_NAME.match(path.name)
+            if (
+                (not options['names'] or path.name in options['names'])
+                and options['view'] in (None, match['view'])
+                and options['action'] in (None, match['action'])
+            ):
+                profiles.append((path, match))
+        return profiles
+
+    def handle(self, *args, **options):
+        profiles = self.select(options)
+        if not profiles:
+            raise CommandError(NO_PROFILES)
+        for path, match in profiles:
+            self.stdout.write(
+                f'{path.name}  {match["view"]}.{match["action"]}  '
+                f'{match["duration"]} мс'
+            )
+        if not options['summary']:
+            return
+        output = StringIO()
+        stats = pstats.Stats(
+            *(str(path) for path, _ in profiles),
+            stream=output
+        )
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(
+            options['limit']
+        )
+        self.stdout.write(output.getvalue())
@@ -0,0 +1,43 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import IngredientRecipe, ShoppingListItem
+
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает суммы продуктов в списках покупок пользователей '
+        'по рецептам в списках покупок.'
+    )
+
+    def handle(self, *args, **options):
+        items = (
+            ShoppingListItem(
+                user_id=item['recipe__shoppingcarts__user'],
+                ingredient_id=item['ingredient'],
+                amount=item['amount']
+            )
+            for item in IngredientRecipe.objects.filter(
+                recipe__shoppingcarts__isnull=False
+            ).values(
+                'recipe__shoppingcarts__user',
+                'ingredient'
+            ).annotate(
+                amount=Sum('amount')
+            ).order_by().iterator(chunk_size=BATCH_SIZE)
+        )
+        count = 0
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            while batch := list(islice(items, BATCH_SIZE)):
+                ShoppingListItem.objects.bulk_create(batch)
+                count += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны: {count} записей.'
+        ))
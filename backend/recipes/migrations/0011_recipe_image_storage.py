@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:45
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(help_text='Добавьте изображение готового блюда', storage=recipes.storage.ContentAddressedStorage(), upload_to='recipe/images/', verbose_name='Изображение'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:47
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    SearchVector = django.contrib.postgres.search.SearchVector
+    config = settings.SEARCH_CONFIG
+    ingredient_names = models.Subquery(
+        IngredientRecipe.objects.filter(
+            recipe=models.OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    Recipe.objects.update(search_vector=(
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(
+            Coalesce(ingredient_names, models.Value('')),
+            weight='B',
+            config=config
+        )
+        + SearchVector('text', weight='C', config=config)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Название, продукты и описание рецепта для поиска', null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+        migrations.RunPython(
+            fill_search_vectors,
+            migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:49
+
+from django.db import migrations, models
+import recipes.operations
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0012_recipe_search_vector'),
+    ]
+
+    operations = [
+        recipes.operations.AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['-created_at', 'name', 'id'], name='recipe_created_name_idx'),
+        ),
+        recipes.operations.AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-created_at', 'name', 'id'], name='recipe_author_created_idx'),
+        ),
+        recipes.operations.AddIndexConcurrently(
+            model_name='subscribe',
+            index=models.Index(fields=['user', 'author'], name='subscribe_user_author_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name',
+        'measurement_unit'
+    ).annotate(
+        keep=models.Min('id'),
+        total=models.Count('id')
+    ).filter(total__gt=1).order_by()
+    for duplicate in duplicates:
+        others = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(pk=duplicate['keep'])
+        for model, owner in (
+            (IngredientRecipe, 'recipe_id'),
+            (ShoppingListItem, 'user_id'),
+        ):
+            for item in model.objects.filter(ingredient__in=others):
+                kept = model.objects.filter(
+                    ingredient_id=duplicate['keep'],
+                    **{owner: getattr(item, owner)}
+                ).first()
+                if kept is None:
+                    item.ingredient_id = duplicate['keep']
+                    item.save()
+                    continue
+                kept.amount += item.amount
+                kept.save()
+                item.delete()
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients,
+            migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
@@ -1,8 +1,11 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
 
+from .storage import ContentAddressedStorage
 from .validators import validate_username
 
 
@@ -87,6 +90,12 @@ class Subscribe(models.Model):
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
         ordering = ('author',)
+        indexes = (
+            models.Index(
+                fields=('user', 'author'),
+                name='subscribe_user_author_idx'
+            ),
+        )
         constraints = [
             models.UniqueConstraint(
                 fields=['author', 'user'],
@@ -155,6 +164,12 @@ class Ingredient(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
         ordering = ('name',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_name_unit'
+            ),
+        )
 
     def __str__(self):
         return f'{self.name[:20]}, {self.measurement_unit}'
@@ -197,18 +212,46 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Изображение',
         upload_to='recipe/images/',
+        storage=ContentAddressedStorage(),
         help_text='Добавьте изображение готового блюда',
     )
+    image_derivatives = models.JSONField(
+        verbose_name='Копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='Уменьшенные копии изображения по форматам и ширинам'
+    )
     created_at = models.DateTimeField(
         verbose_name='Дата создания',
         auto_now_add=True
     )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+        help_text='Название, продукты и описание рецепта для поиска'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at', 'name')
         default_related_name = 'recipes'
+        indexes = (
+            models.Index(
+                fields=('-created_at', 'name', 'id'),
+                name='recipe_created_name_idx'
+            ),
+            models.Index(
+                fields=('author', '-created_at', 'name', 'id'),
+                name='recipe_author_created_idx'
+            ),
+            GinIndex(
+                fields=('search_vector',),
+                name='recipe_search_vector_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name[:20]
@@ -311,3 +354,43 @@ class Favorite(UserAndRecipeBase):
 
     def __str__(self):
         return self.recipe.name[:20]
+
+
+class ShoppingListItem(models.Model):
+    """
+    Суммарная мера продукта в списке покупок пользователя.
+    Поддерживается при изменении списка покупок и продуктов рецептов,
+    восстанавливается командой rebuild_shopping_lists.
+    Для одного пользователя продукты не могут повторятся.
+    """
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        help_text='Введите пользователя'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Продукт',
+        on_delete=models.CASCADE,
+        help_text='Введите продукт'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Мера',
+        help_text='Введите меру'
+    )
+
+    class Meta:
+        verbose_name = 'Продукт списка покупок'
+        verbose_name_plural = 'Продукты списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient',
+            )
+        ]
+        default_related_name = 'shopping_list_items'
+
+    def __str__(self):
+        return self.ingredient.name[:20]
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector
+)
+from django.db import connections
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When
+)
+from django.db.models.functions import Cast, Coalesce
+
+from .models import IngredientRecipe, Recipe
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def update_search_vectors(recipes):
+    """
+    Функция пересчета поисковых векторов рецептов:
+    название (вес A), названия продуктов (вес B) и описание (вес C).
+    Вектор хранится только в PostgreSQL.
+    """
+    if not is_postgresql(recipes):
+        return
+    config = settings.SEARCH_CONFIG
+    ingredient_names = Subquery(
+        IngredientRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    recipes.update(search_vector=(
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(
+            Coalesce(ingredient_names, Value('')),
+            weight='B',
+            config=config
+        )
+        + SearchVector('text', weight='C', config=config)
+    ))
+
+
+def search_recipes(recipes, query):
+    """
+    Функция полнотекстового поиска рецептов с сортировкой
+    по релевантности (аннотация rank).
+    В PostgreSQL используется индексированный поисковый вектор,
+    в других СУБД - поиск подстрок (LIKE) каждого слова запроса
+    в названии, описании и названиях продуктов; релевантность
+    равна числу слов запроса в названии.
+    Релевантность PostgreSQL (real) приводится к double precision:
+    значение real не сохраняется точно в курсоре пагинации,
+    и сравнение с ним пропускает или повторяет записи.
+    """
+    ordering = ('-rank', *Recipe._meta.ordering)
+    if is_postgresql(recipes):
+        search_query = SearchQuery(
+            query,
+            config=settings.SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        return recipes.filter(search_vector=search_query).annotate(
+            rank=Cast(
+                SearchRank(F('search_vector'), search_query),
+                FloatField()
+            )
+        ).order_by(*ordering)
+    words = query.split()
+    if not words:
+        return recipes.none()
+    for word in words:
+        recipes = recipes.filter(
+            Q(name__icontains=word)
+            | Q(text__icontains=word)
+            | Exists(IngredientRecipe.objects.filter(
+                recipe=OuterRef('pk'),
+                ingredient__name__icontains=word
+            ))
+        )
+    return recipes.annotate(rank=sum(
+        Case(
+            When(name__icontains=word, then=1),
+            default=0,
+            output_field=IntegerField()
+        )
+        for word in words
+    )).order_by(*ordering)
@@ -0,0 +1,42 @@
+import os
+from hashlib import sha256
+from pathlib import PurePosixPath
+from uuid import uuid4
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище файлов с именами по хэшу содержимого (SHA-256).
+    Одинаковые файлы хранятся один раз, содержимое файла с заданным
+    именем никогда не меняется.
+    Из исходного имени сохраняются каталог и расширение:
+    recipe/images/photo.jpg -> recipe/images/ab/ab12...ef.jpg.
+    """
+
+    def content_name(self, name, content):
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        path = PurePosixPath(name)
+        digest = digest.hexdigest()
+        return str(
+            path.parent / digest[:2] / f'{digest}{path.suffix.lower()}'
+        )
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Обновление времени изменения защищает файл от удаления
+            # командой delete_orphan_images до сохранения ссылки на него.
+            os.utime(self.path(name))
+            return name
+        # Файл записывается под временным именем и атомарно заменяет
+        # файл с именем по содержимому: параллельное сохранение того же
+        # содержимого не создает копию с суффиксом, а недописанный файл
+        # не виден по этому имени.
+        temporary = super()._save(f'{name}.{uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name